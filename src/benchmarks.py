@@ -0,0 +1,328 @@
+"""
+Benchmarks and load test for the validate-pdf-data path.
+
+Generates a synthetic database.csv and a fake PdfService returning matching payloads with configurable latency,
+times each stage of the pipeline, drives the app with concurrent requests and writes the results as json.
+Results can be compared against a stored baseline; the exit code is 1 if any benchmark regressed.
+
+Usage:
+    python -m src.benchmarks --companies 10000 --output bench.json
+    python -m src.benchmarks --companies 10000 --baseline bench.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from decimal import Decimal
+from unittest.mock import patch
+
+CSV_COLUMNS = ['Company Name', 'Industry', 'Market Capitalization', 'Revenue (in millions)', 'EBITDA (in millions)',
+               'Net Income (in millions)', 'Debt (in millions)', 'Equity (in millions)',
+               'Enterprise Value (in millions)', 'P/E Ratio', 'Revenue Growth Rate (%)', 'EBITDA Margin (%)',
+               'Net Income Margin (%)', 'ROE (Return on Equity) (%)', 'ROA (Return on Assets) (%)', 'Current Ratio',
+               'Debt to Equity Ratio', 'Location']
+INDUSTRIES = ['Technology', 'Healthcare', 'Retail', 'Financial Services', 'Manufacturing']
+LOCATIONS = ['San Francisco', 'New York', 'Chicago', 'Boston', 'Dallas']
+
+
+def company_name(i: int) -> str:
+    return f"Company{i:07d}"
+
+
+def generate_company_rows(count: int, seed: int = 0) -> list[dict]:
+    """
+    Generate synthetic company rows in the same format as data/database.csv.
+
+    :param count: number of companies
+    :param seed: random seed, so runs with the same arguments use the same data
+    :return: list of dicts keyed by csv column
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        revenue = rng.randint(100, 5000)
+        ebitda = rng.randint(10, revenue)
+        net_income = rng.randint(1, ebitda)
+        debt = rng.randint(10, 1000)
+        equity = rng.randint(100, 2000)
+        market_cap = rng.randint(500, 10000)
+        rows.append({
+            'Company Name': company_name(i),
+            'Industry': rng.choice(INDUSTRIES),
+            'Market Capitalization': str(market_cap),
+            'Revenue (in millions)': str(revenue),
+            'EBITDA (in millions)': str(ebitda),
+            'Net Income (in millions)': str(net_income),
+            'Debt (in millions)': str(debt),
+            'Equity (in millions)': str(equity),
+            'Enterprise Value (in millions)': str(market_cap + debt),
+            'P/E Ratio': str(rng.randint(5, 40)),
+            'Revenue Growth Rate (%)': str(rng.randint(0, 30)),
+            'EBITDA Margin (%)': f"{ebitda * 100 / revenue:.2f}",
+            'Net Income Margin (%)': f"{net_income * 100 / revenue:.2f}",
+            'ROE (Return on Equity) (%)': f"{net_income * 100 / equity:.2f}",
+            'ROA (Return on Assets) (%)': f"{net_income * 100 / (debt + equity):.2f}",
+            'Current Ratio': f"{rng.uniform(0.5, 4):.1f}",
+            'Debt to Equity Ratio': f"{debt / equity:.2f}",
+            'Location': rng.choice(LOCATIONS),
+        })
+    return rows
+
+
+def write_synthetic_csv(path: str, rows: list[dict]):
+    """
+    Write generated rows as a database.csv file.
+    """
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+class FakePdfService:
+    """
+    Stand-in for PdfService returning payloads for the synthetic companies after a fixed latency.
+    A share of payloads (mismatch_rate) have a restated revenue, so comparisons find mismatches.
+    """
+    rows_by_path: dict[str, dict] = {}
+    latency = 0.0
+    mismatch_rate = 0.1
+
+    def __init__(self, key: str):
+        self.key = key
+
+    def extract(self, file_path: str):
+        time.sleep(self.latency)
+        row = self.rows_by_path.get(file_path)
+        if row is None:
+            raise FileNotFoundError("Cannot extract data. Invalid file provided.")
+        payload = dict(row)
+        if zlib.crc32(file_path.encode()) % 100 < self.mismatch_rate * 100:
+            payload['Revenue (in millions)'] = str(Decimal(row['Revenue (in millions)']) + 1)
+        return payload
+
+    @classmethod
+    def configure(cls, rows: list[dict], latency: float, mismatch_rate: float):
+        cls.rows_by_path = {f"assets/{row['Company Name'].lower()}.pdf": row for row in rows}
+        cls.latency = latency
+        cls.mismatch_rate = mismatch_rate
+
+
+def time_operation(name: str, func, calls: int, results: dict, repeat: int = 3, items_per_call: int = 1):
+    """
+    Time calls of func, keeping the best of repeat runs, and store per-operation timings in results.
+    For batched functions, items_per_call gives the number of operations each call covers.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(calls):
+            func(i)
+        best = min(best, time.perf_counter() - start)
+    ops = calls * items_per_call
+    results[name] = {"ops": ops, "total_seconds": best, "per_op_us": best / ops * 1e6}
+    print(f"{name:40} {best / ops * 1e6:12.2f} us/op", file=sys.stderr)
+
+
+def import_times(module: str) -> dict[str, int]:
+    """
+    Import a module in a fresh interpreter, as a worker or script would, and return the cumulative import time in
+    microseconds of every module that was loaded.
+
+    :param module: module to import, e.g. src.main
+    :return: dict mapping module name to cumulative import time
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=root,
+                               capture_output=True, text=True, check=True)
+    times = {}
+    for line in completed.stderr.splitlines():
+        _, _, cumulative, name = line.replace("|", ":").split(":")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def run_microbenchmarks(rows: list[dict], db_location: str, ops: int) -> dict:
+    """
+    Time each stage of the validation pipeline in isolation.
+    """
+    from src.data_discrepancy_checker import get_bulk_mismatches, get_mismatched_fields, validate_company_data
+    from src.data_layer import load_company_data, load_many_company_data
+    from src.models import CompanyData
+    from src.pdf_service_api import extract_and_parse_pdf_data, extraction_cache
+    from src.projections import ResponseView, get_projection
+    from src.snapshot import SnapshotCompanyBackend, compile_snapshot
+    from src.storage import CsvCompanyBackend
+
+    results = {}
+    for module in ("src.main", "src.reconcile"):
+        best = min(import_times(module)[module] for _ in range(3))
+        results[f"import_{module.replace('.', '_')}"] = {"ops": 1, "total_seconds": best / 1e6, "per_op_us": best}
+        print(f"{'import ' + module:40} {best:12.2f} us", file=sys.stderr)
+
+    rng = random.Random(1)
+    names = [company_name(rng.randrange(len(rows))) for _ in range(ops)]
+    pdf_files = [io.BytesIO(name.encode()) for name in names]
+
+    time_operation("csv_index_build", lambda i: CsvCompanyBackend(db_location).get(names[0]), 1, results)
+    snapshot_location = os.path.splitext(db_location)[0] + ".snap"
+    time_operation("snapshot_compile", lambda i: compile_snapshot(db_location, snapshot_location), 1, results)
+    time_operation("snapshot_open", lambda i: SnapshotCompanyBackend(snapshot_location).get(names[0]), 1, results)
+    snapshot_backend = SnapshotCompanyBackend(snapshot_location)
+    time_operation("snapshot_get", lambda i: snapshot_backend.get(names[i]), ops, results)
+    time_operation("load_company_data", lambda i: load_company_data(names[i]), ops, results)
+    batch = names[:100]
+    time_operation("load_many_company_data", lambda i: load_many_company_data(batch), max(ops // 100, 1),
+                   results, items_per_call=len(batch))
+    time_operation("parse_company_data", lambda i: CompanyData(**rows[i % len(rows)]), ops, results)
+
+    stored = [load_company_data(name) for name in names]
+    extracted = [CompanyData(**FakePdfService('').extract(f"assets/{name.lower()}.pdf")) for name in names]
+    time_operation("get_mismatched_fields", lambda i: get_mismatched_fields(extracted[i], stored[i]), ops, results)
+    time_operation("validate_company_data", lambda i: validate_company_data(extracted[i], stored[i]), ops, results)
+    time_operation("get_bulk_mismatches", lambda i: get_bulk_mismatches(extracted, stored), 1, results,
+                   items_per_call=ops)
+
+    responses = [validate_company_data(extracted[i], stored[i]) for i in range(ops)]
+    for view in ResponseView:
+        projection = get_projection(view)
+        time_operation(f"serialize_{view.value}", lambda i: projection.to_json(responses[i]), ops, results)
+
+    extraction_cache.clear()
+    time_operation("extract_and_parse_pdf_data_miss",
+                   lambda i: extract_and_parse_pdf_data(names[i], io.BytesIO(f"{i}".encode())), ops, results,
+                   repeat=1)
+    time_operation("extract_and_parse_pdf_data_hit", lambda i: extract_and_parse_pdf_data(names[i], pdf_files[i]),
+                   ops, results)
+    return results
+
+
+async def run_load_test(rows: list[dict], requests: int, concurrency: int) -> dict:
+    """
+    Drive the validate-pdf-data route with concurrent requests and record latency percentiles and throughput.
+    """
+    import httpx
+    from src.main import app
+
+    rng = random.Random(2)
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one_request(i):
+            name = company_name(rng.randrange(len(rows)))
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await client.post('/company/validate-pdf-data', params={'company_name': name},
+                                         files={'data_file': (f'{name}.pdf', f'{name}-{i}'.encode(),
+                                                              'application/pdf')})
+                latencies.append(time.perf_counter() - start)
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    result = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "total_seconds": elapsed,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "statuses": {str(status): count for status, count in statuses.items()},
+    }
+    print(f"{'load_test':40} {result['throughput_rps']:12.1f} req/s  p50 {result['p50_ms']:.1f}ms  "
+          f"p99 {result['p99_ms']:.1f}ms", file=sys.stderr)
+    return result
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compare microbenchmark and load test results against a baseline run.
+
+    :param results: results of this run
+    :param baseline: results of the baseline run
+    :param tolerance: allowed slowdown as a fraction, e.g. 0.2 for 20%
+    :return: list of regression descriptions, empty if none
+    """
+    regressions = []
+    for name, result in results["microbenchmarks"].items():
+        base = baseline.get("microbenchmarks", {}).get(name)
+        if base and result["per_op_us"] > base["per_op_us"] * (1 + tolerance):
+            regressions.append(f"{name}: {result['per_op_us']:.2f}us/op vs baseline {base['per_op_us']:.2f}us/op")
+
+    load_test, base_load_test = results.get("load_test"), baseline.get("load_test")
+    if load_test and base_load_test:
+        if load_test["throughput_rps"] < base_load_test["throughput_rps"] / (1 + tolerance):
+            regressions.append(f"load_test throughput: {load_test['throughput_rps']:.1f}req/s vs baseline "
+                               f"{base_load_test['throughput_rps']:.1f}req/s")
+        if load_test["p99_ms"] > base_load_test["p99_ms"] * (1 + tolerance):
+            regressions.append(f"load_test p99: {load_test['p99_ms']:.1f}ms vs baseline "
+                               f"{base_load_test['p99_ms']:.1f}ms")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=10_000, help="number of synthetic companies (1k to 1M)")
+    parser.add_argument("--ops", type=int, default=1000, help="operations per microbenchmark")
+    parser.add_argument("--requests", type=int, default=500, help="requests sent by the load test, 0 to skip it")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent requests in the load test")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake pdf service takes per call")
+    parser.add_argument("--mismatch-rate", type=float, default=0.1, help="share of payloads with a mismatch")
+    parser.add_argument("--output", help="write results json to this file (default stdout)")
+    parser.add_argument("--baseline", help="compare results against this results json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    rows = generate_company_rows(args.companies)
+    FakePdfService.configure(rows, latency=args.latency, mismatch_rate=args.mismatch_rate)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_location = os.path.join(tmp_dir, "database.csv")
+        write_synthetic_csv(db_location, rows)
+        # settings are built on first use and then kept, so point them at the synthetic data first
+        os.environ["DB_LOCATION"] = db_location
+        os.environ.setdefault("EXTRACTION_CACHE_MAX_ENTRIES", str(max(args.ops, args.requests) * 2))
+
+        with patch("src.pdf_service_api.PdfService", FakePdfService):
+            results = {
+                "config": vars(args),
+                "microbenchmarks": run_microbenchmarks(rows, db_location, min(args.ops, args.companies)),
+            }
+            if args.requests:
+                results["load_test"] = asyncio.run(run_load_test(rows, args.requests, args.concurrency))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
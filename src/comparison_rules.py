@@ -0,0 +1,98 @@
+import operator
+import re
+from decimal import Decimal
+from typing import Any, Callable, Iterable, Optional
+from pydantic import BaseModel, ConfigDict
+
+# returns True if the uploaded and stored values differ
+FieldComparator = Callable[[Any, Any], bool]
+
+
+class FieldRule(BaseModel):
+    """
+    How a single CompanyData field is compared. Fields without a rule are compared exactly.
+    Numeric values match if they are within either the absolute or the relative tolerance.
+    """
+    abs_tolerance: Optional[Decimal] = None
+    rel_tolerance: Optional[Decimal] = None
+    normalize_text: bool = False
+    ignore: bool = False
+
+    model_config = ConfigDict(frozen=True)
+
+
+# percentages and ratios in filings are rounded to 2 decimal places, so allow for rounding noise of up to half a unit
+# in the last place while still reporting a one unit difference (e.g. 13.33 vs 13.34)
+ROUNDING_RULE = FieldRule(abs_tolerance=Decimal("0.005"))
+TEXT_RULE = FieldRule(normalize_text=True)
+
+FIELD_RULES: dict[str, FieldRule] = {
+    "pe_ratio": ROUNDING_RULE,
+    "revenue_growth_rate": ROUNDING_RULE,
+    "ebitda_margin": ROUNDING_RULE,
+    "net_income_margin": ROUNDING_RULE,
+    "roe": ROUNDING_RULE,
+    "roa": ROUNDING_RULE,
+    "current_ratio": ROUNDING_RULE,
+    "debt_to_equity_ratio": ROUNDING_RULE,
+    "location": TEXT_RULE,
+    "ceo": TEXT_RULE,
+}
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_text(value: str) -> str:
+    """
+    Normalise text for comparison, ignoring case, punctuation and repeated whitespace.
+    """
+    return " ".join(_PUNCTUATION.sub(" ", value).casefold().split())
+
+
+def _tolerance_comparator(abs_tolerance: Decimal | None, rel_tolerance: Decimal | None) -> FieldComparator:
+    abs_tolerance = abs_tolerance or 0
+    rel_tolerance = rel_tolerance or 0
+
+    def differs(uploaded, stored) -> bool:
+        if uploaded is None or stored is None:
+            return uploaded is not stored
+        difference = abs(uploaded - stored)
+        return difference > abs_tolerance and difference > rel_tolerance * max(abs(uploaded), abs(stored))
+
+    return differs
+
+
+def _text_comparator(uploaded, stored) -> bool:
+    if uploaded is None or stored is None:
+        return uploaded is not stored
+    return normalize_text(uploaded) != normalize_text(stored)
+
+
+def compile_comparators(model: type[BaseModel], rules: dict[str, FieldRule],
+                        ignore: Iterable[str] = ()) -> dict[str, FieldComparator]:
+    """
+    Build a comparator for every field of model, in field order. Ignored fields are left out of the table.
+
+    :param model: model class the rules apply to, e.g. CompanyData
+    :param rules: dict mapping field name to FieldRule
+    :param ignore: names of additional fields to ignore
+    :return: dict mapping field name to a function returning True if two values differ
+    """
+    ignore = set(ignore)
+    unknown_fields = (set(rules) | ignore) - set(model.model_fields)
+    if unknown_fields:
+        raise ValueError(f"Unknown fields in comparison rules: {', '.join(sorted(unknown_fields))}")
+
+    comparators = {}
+    for field in model.model_fields:
+        rule = rules.get(field, FieldRule())
+        if rule.ignore or field in ignore:
+            continue
+        if rule.normalize_text:
+            comparators[field] = _text_comparator
+        elif rule.abs_tolerance or rule.rel_tolerance:
+            comparators[field] = _tolerance_comparator(rule.abs_tolerance, rule.rel_tolerance)
+        else:
+            comparators[field] = operator.ne
+
+    return comparators
@@ -1,28 +1,78 @@
-from pydantic_settings import BaseSettings
+from functools import lru_cache
+from pydantic_settings import BaseSettings, InitSettingsSource
 import os
 
 
-environment = os.getenv("ENVIRONMENT", "DEV")
+def environment_defaults(environment: str) -> dict:
+    """
+    Return the settings that differ between the DEV, TEST and PROD environments.
 
+    :param environment: value of the ENVIRONMENT environment variable
+    :return: dict of setting name to default value
+    """
+    if environment == "DEV":
+        return {"debug": True, "api_key": 'TEST_KEY', "db_location": 'data/database.csv'}
+    if environment == "TEST":
+        return {"debug": True, "api_key": 'TEST_KEY', "db_location": '../data/database.csv'}
+    if environment == "PROD":
+        # assume we have a real db set up for prod
+        return {"debug": False, "api_key": os.getenv("API_KEY"), "db_location": os.getenv("DATABASE_URL")}
+    raise ValueError(f"Unknown ENVIRONMENT {environment}, expected DEV, TEST or PROD.")
 
-if environment == "DEV":
-    class Settings(BaseSettings):
-        environment: str = environment
-        debug: bool = True
-        api_key: str = 'TEST_KEY'
-        db_location: str = 'data/database.csv'
-elif environment == "TEST":
-    class Settings(BaseSettings):
-        environment: str = environment
-        debug: bool = True
-        api_key: str = 'TEST_KEY'
-        db_location: str = '../data/database.csv'
-elif environment == "PROD":
-    class Settings(BaseSettings):
-        environment: str = environment
-        debug: bool = False
-        api_key: str = os.getenv("API_KEY")
-        db_location: str = os.getenv("DATABASE_URL") # assume we have a real db set up for prod
 
+class Settings(BaseSettings):
+    """
+    Settings for the environment named by the ENVIRONMENT environment variable (DEV by default).
+    Each can be overridden by an environment variable of the same name.
+    """
+    environment: str = "DEV"
+    debug: bool = False
+    api_key: str | None = None
+    db_location: str | None = None
+    db_pool_size: int = 4  # max open connections for sql storage backends
+    extraction_max_concurrency: int = 8  # max extractions in flight against the pdf service
+    extraction_workers: int = 8  # threads available for blocking pdf service calls
+    extraction_timeout: float = 30.0  # seconds before a single extraction is abandoned
+    pdf_service_pool_max_size: int = 8  # max authenticated pdf service clients kept open
+    pdf_service_pool_timeout: float = 30.0  # seconds to wait for a free pdf service client
+    extraction_cache_max_entries: int = 1024  # extractions kept in memory
+    extraction_cache_dir: str | None = None  # directory for the on-disk cache tier, disabled if unset
+    extraction_cache_ttl: float | None = None  # seconds an on-disk entry stays valid, no expiry if unset
+    extraction_cache_max_disk_bytes: int | None = None  # size limit for the on-disk tier, unbounded if unset
+    pre_extraction_watch_dir: str | None = None  # directory polled for pdfs to extract ahead of time, off if unset
+    pre_extraction_poll_interval: float = 30.0  # seconds between scans of the watch directory
+    pre_extraction_workers: int = 2  # threads extracting queued pdfs
+    pre_extraction_max_retries: int = 3  # retries for a failed extraction
+    pre_extraction_backoff: float = 1.0  # seconds before the first retry, doubled for each further retry
+    slow_request_threshold: float = 1.0  # seconds after which a request logs its stage breakdown
+    comparison_ignore_fields: list[str] = []  # CompanyData fields left out of discrepancy checks
+    validation_results_max_entries: int = 1024  # companies whose latest validation result is kept for re-validation
+    stored_data_refresh_interval: float | None = None  # seconds between checks for stored data changes, off if unset
+    max_upload_bytes: int = 50 * 1024 * 1024  # request body limit for single pdf uploads
+    max_batch_upload_bytes: int = 500 * 1024 * 1024  # request body limit for batch and stream uploads
+    upload_spool_max_bytes: int = 1024 * 1024  # streamed uploads larger than this are spooled to a temp file
+    shared_cache_path: str | None = None  # sqlite file caching data across worker processes, off if unset
+    shared_cache_max_entries: int = 100_000  # entries kept per shared cache namespace, oldest writes evicted first
+    stored_data_local_max_entries: int = 1024  # stored data records each worker keeps in front of the shared cache
 
-settings = Settings()
+    @classmethod
+    def settings_customise_sources(cls, settings_cls, init_settings, env_settings, dotenv_settings,
+                                   file_secret_settings):
+        # per environment defaults rank below environment variables, like the field defaults
+        defaults = InitSettingsSource(settings_cls, init_kwargs=environment_defaults(os.getenv("ENVIRONMENT", "DEV")))
+        return init_settings, env_settings, dotenv_settings, file_secret_settings, defaults
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """
+    Return the settings, reading the environment on first use rather than at import.
+    """
+    return Settings()
+
+
+def __getattr__(name: str):
+    # keeps `from src.config import settings` working while deferring the build to first use
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
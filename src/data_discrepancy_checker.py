@@ -1,34 +1,156 @@
+import operator
+from functools import cache
+from typing import Sequence
+from src.comparison_rules import FIELD_RULES, FieldComparator, compile_comparators
+from src.metrics import stage_timer
 from src.models import CompanyData, MismatchedFields, DataDiscrepancyCheckerResponse
 
+COMPANY_FIELDS = tuple(CompanyData.model_fields)
+
+
+@cache
+def get_comparators() -> dict[str, FieldComparator]:
+    """
+    Return the comparator for each compared field, compiled on first use so comparisons don't re-inspect the model
+    or rules on every call. Fields in settings.comparison_ignore_fields are left out.
+
+    :return: dict mapping field name to comparator
+    """
+    # imported here so offline tools importing this module don't load settings until they compare
+    from src.config import get_settings
+    return compile_comparators(CompanyData, FIELD_RULES, ignore=get_settings().comparison_ignore_fields)
+
 
 def validate_company_data(extracted_data: CompanyData, stored_data: CompanyData) -> DataDiscrepancyCheckerResponse:
     """
     Returns a response object containing extracted_data, stored_data and any mismatched fields.
     """
-    mismatched_fields = get_mismatched_fields(extracted_data=extracted_data, stored_data=stored_data)
+    with stage_timer("compare"):
+        mismatched_fields = get_mismatched_fields(extracted_data=extracted_data, stored_data=stored_data)
 
-    return DataDiscrepancyCheckerResponse(uploaded_data=extracted_data,
-                                          stored_data=stored_data,
-                                          mismatched_fields=mismatched_fields)
+    with stage_timer("build_response"):
+        return DataDiscrepancyCheckerResponse(uploaded_data=extracted_data,
+                                              stored_data=stored_data,
+                                              mismatched_fields=mismatched_fields)
 
 
 def get_mismatched_fields(extracted_data: CompanyData, stored_data: CompanyData) -> list[MismatchedFields]:
     """
     Compares extracted_data and stored_data and returns a list of mismatched fields if any are found.
+    Fields are compared using the rules in comparison_rules.FIELD_RULES.
 
     :param extracted_data: CompanyData object containing extracted pdf data
     :param stored_data: CompanyData object to compare extracted data against
     :return: list containing mismatched fields (if any)
     """
-    extracted_dict = extracted_data.model_dump()
-    stored_dict = stored_data.model_dump()
-
     mismatched_fields = []
-    for key in extracted_dict.keys():
-        stored = stored_dict.get(key)
-        uploaded = extracted_dict.get(key)
-        if stored != uploaded:
+    for key, differs in get_comparators().items():
+        stored = getattr(stored_data, key)
+        uploaded = getattr(extracted_data, key)
+        if differs(uploaded, stored):
             mismatched_fields.append(MismatchedFields(field_name=key, uploaded_value=uploaded, stored_value=stored))
 
     return mismatched_fields
 
+
+def to_columns(records: Sequence[CompanyData]) -> dict[str, list]:
+    """
+    Transpose a sequence of CompanyData objects into one list of values per field.
+
+    :param records: CompanyData objects
+    :return: dict mapping field name to list of values, in record order
+    """
+    return {field: list(map(operator.attrgetter(field), records)) for field in COMPANY_FIELDS}
+
+
+class MismatchMatrix:
+    """
+    Result of comparing columns of extracted and stored records.
+
+    Mismatches are held as one bytearray per field with a 1 for every record where that field differs, so the
+    comparison never builds per-record dicts or objects. MismatchedFields objects are only created on request.
+    """
+
+    def __init__(self, extracted_columns: dict[str, list], stored_columns: dict[str, list],
+                 mismatches: dict[str, bytearray]):
+        self.extracted_columns = extracted_columns
+        self.stored_columns = stored_columns
+        self.mismatches = mismatches
+
+    def __len__(self) -> int:
+        return len(next(iter(self.mismatches.values()), b''))
+
+    def mismatch_counts(self) -> dict[str, int]:
+        """
+        Return number of mismatched records per field.
+        """
+        return {field: column.count(1) for field, column in self.mismatches.items()}
+
+    def mismatched_rows(self) -> list[int]:
+        """
+        Return indexes of records with at least one mismatched field.
+        """
+        # OR every field's column together as one big integer; non-zero bytes mark mismatched records
+        combined = 0
+        for column in self.mismatches.values():
+            combined |= int.from_bytes(column, 'little')
+        row_flags = combined.to_bytes(len(self), 'little')
+        return [i for i, flag in enumerate(row_flags) if flag]
+
+    def mismatched_field_names(self, row: int) -> list[str]:
+        """
+        Return names of mismatched fields for a single record.
+
+        :param row: record index
+        """
+        return [field for field, column in self.mismatches.items() if column[row]]
+
+    def mismatched_fields(self, row: int) -> list[MismatchedFields]:
+        """
+        Build MismatchedFields objects for a single record, matching the output of get_mismatched_fields.
+
+        :param row: record index
+        """
+        return [MismatchedFields(field_name=field,
+                                 uploaded_value=self.extracted_columns[field][row],
+                                 stored_value=self.stored_columns[field][row])
+                for field in self.mismatched_field_names(row)]
+
+
+def compare_columns(extracted_columns: dict[str, list], stored_columns: dict[str, list],
+                    comparators: dict[str, FieldComparator] | None = None) -> MismatchMatrix:
+    """
+    Compares columns of extracted and stored data field by field and returns a mismatch matrix.
+    Records are paired by position, so every column must have the same length.
+
+    :param extracted_columns: dict mapping field name to extracted values, see to_columns
+    :param stored_columns: dict mapping field name to stored values, see to_columns
+    :param comparators: dict mapping field name to comparator, fields missing from it are not compared,
+                        default get_comparators()
+    :return: MismatchMatrix of the compared records
+    """
+    if comparators is None:
+        comparators = get_comparators()
+    lengths = {len(column) for column in (*extracted_columns.values(), *stored_columns.values())}
+    if len(lengths) > 1:
+        raise ValueError("All columns must have the same length.")
+
+    mismatches = {field: bytearray(map(differs, extracted_columns[field], stored_columns[field]))
+                  for field, differs in comparators.items() if field in extracted_columns}
+
+    return MismatchMatrix(extracted_columns=extracted_columns, stored_columns=stored_columns, mismatches=mismatches)
+
+
+def get_bulk_mismatches(extracted_records: Sequence[CompanyData],
+                        stored_records: Sequence[CompanyData]) -> MismatchMatrix:
+    """
+    Compares many pairs of extracted and stored records at once. Records are paired by position.
+
+    :param extracted_records: CompanyData objects containing extracted pdf data
+    :param stored_records: CompanyData objects to compare extracted data against
+    :return: MismatchMatrix of the compared records
+    """
+    if len(extracted_records) != len(stored_records):
+        raise ValueError("Expected the same number of extracted and stored records.")
+
+    return compare_columns(to_columns(extracted_records), to_columns(stored_records))
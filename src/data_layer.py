@@ -1,23 +1,236 @@
-import csv
-from src.models import CompanyData
-from src.config import settings
+import logging
+import threading
+from collections import OrderedDict
+from src.models import CompanyData, CompanyRecord
+from src.config import get_settings
+from src.metrics import stage_timer
+from src.shared_cache import STORED_DATA_NAMESPACE, SharedCache, get_shared_cache
+from src.storage import ChangeListener, CompanyStorageBackend, create_backend, normalize_company_name
+
+logger = logging.getLogger(__name__)
+
+_backend: CompanyStorageBackend | None = None
+_backend_lock = threading.Lock()
+_change_listeners: list[ChangeListener] = []
+# set once the stored data turns out to have more companies than the shared cache holds
+_shared_stored_data_too_large = False
+
+
+class _LocalRecords:
+    """
+    This worker's view of the stored data in the shared cache: the version of the stored data it last synced, the
+    generation of the shared cache load it last told stored data listeners about, and an LRU of the records it
+    most recently read, for the synced version. Companies not found are kept as None.
+    """
+
+    def __init__(self):
+        self.version: str | None = None
+        self.generation: int | None = None
+        self._entries: OrderedDict[str, CompanyRecord | None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start_version(self, version: str):
+        with self._lock:
+            self._entries.clear()
+            self.version = version
+
+    def get(self, version: str | None, name_key: str) -> tuple[bool, CompanyRecord | None]:
+        with self._lock:
+            if version is None or version != self.version or name_key not in self._entries:
+                return False, None
+            self._entries.move_to_end(name_key)
+            return True, self._entries[name_key]
+
+    def set(self, version: str | None, name_key: str, record: CompanyRecord | None):
+        with self._lock:
+            if version is not None and version == self.version:
+                self._entries[name_key] = record
+                while len(self._entries) > get_settings().stored_data_local_max_entries:
+                    self._entries.popitem(last=False)
+
+
+_local_records = _LocalRecords()
+_shared_sync_lock = threading.Lock()
+
+
+def get_storage_backend() -> CompanyStorageBackend:
+    """
+    Return the storage backend for settings.db_location, creating it on first use.
+
+    :return: storage backend
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                settings = get_settings()
+                backend = create_backend(settings.db_location, pool_size=settings.db_pool_size)
+                for listener in _change_listeners:
+                    backend.add_change_listener(listener)
+                _backend = backend
+    return _backend
+
+
+def add_stored_data_listener(listener: ChangeListener):
+    """
+    Register a function to call whenever stored company data changes, on the current storage backend and any
+    created later.
+
+    :param listener: function taking a dict of changed CompanyData (None for removed companies) keyed by
+                     normalised company name
+    """
+    with _backend_lock:
+        _change_listeners.append(listener)
+        if _backend is not None:
+            _backend.add_change_listener(listener)
+
+
+def refresh_stored_data():
+    """
+    Pick up changes to the stored company data now, notifying stored data listeners of anything that changed.
+    """
+    backend = get_storage_backend()
+    if _synced_shared_cache(backend) is None:
+        backend.refresh()
+
+
+def close_storage_backend():
+    """
+    Close the storage backend, if one was created. A new one is created on next use.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
 
 
 def load_company_data(company_name: str) -> CompanyData | None:
     """
     Fetch stored company data matching company name. Return None if no match found.
+    If a shared cache is configured, lookups are served from it instead of an index in each worker.
 
     :param company_name: name of company
     :return: CompanyData object if found, otherwise None
     """
 
-    with open(settings.db_location, newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row['Company Name'] == company_name:
-                return CompanyData(**row)
+    with stage_timer("load_stored_data"):
+        backend = get_storage_backend()
+        shared_cache = _synced_shared_cache(backend)
+        if shared_cache is None:
+            return backend.get(company_name)
+
+        name_key = normalize_company_name(company_name)
+        record = _load_shared_records(backend, shared_cache, [name_key])[name_key]
+        return record.to_company_data() if record else None
+
+
+def load_many_company_data(company_names: list[str]) -> dict[str, CompanyData | None]:
+    """
+    Fetch stored company data for each company name in a single lookup against the storage backend, or the shared
+    cache if one is configured.
+
+    :param company_names: list of company names
+    :return: dict mapping each company name to its CompanyData object, or None if not found
+    """
+
+    with stage_timer("load_stored_data"):
+        backend = get_storage_backend()
+        shared_cache = _synced_shared_cache(backend)
+        if shared_cache is None:
+            return backend.get_many(company_names)
+
+        name_keys = {company_name: normalize_company_name(company_name) for company_name in company_names}
+        records = _load_shared_records(backend, shared_cache, list(set(name_keys.values())))
+        return {company_name: records[name_key].to_company_data() if records[name_key] else None
+                for company_name, name_key in name_keys.items()}
+
+
+def _synced_shared_cache(backend: CompanyStorageBackend) -> SharedCache | None:
+    """
+    Return the shared cache if stored data is served from it, after making sure it holds the current version of the
+    stored data. The first time this worker sees a new version, stored data listeners are told what changed.
+    """
+    shared_cache = get_shared_cache()
+    if shared_cache is None or _shared_stored_data_too_large:
+        return None
+
+    # a stat per lookup, the shared cache is only invalidated when some worker sees a new version
+    version = backend.source_version()
+    if version is not None and version != _local_records.version:
+        with _shared_sync_lock:
+            if version != _local_records.version:
+                shared_cache.sync_source(STORED_DATA_NAMESPACE, version)
+                if not shared_cache.is_loaded(STORED_DATA_NAMESPACE):
+                    _load_shared_namespace(backend, shared_cache)
+                if _shared_stored_data_too_large:
+                    return None
+                _notify_shared_changes(shared_cache)
+                _local_records.start_version(version)
+    return shared_cache
+
+
+def _notify_shared_changes(shared_cache: SharedCache):
+    # every worker tells its own listeners, the changes are worked out once by the worker that loaded the new data
+    known_generation = _local_records.generation
+    generation, changes = shared_cache.changes_since(STORED_DATA_NAMESPACE, known_generation)
+    if changes is None and known_generation is not None and known_generation != generation:
+        logger.warning("Stored data was reloaded too often since this worker last looked to tell what changed")
+    _local_records.generation = generation
+    if not changes:
+        return
+
+    changed = {name_key: CompanyRecord.from_json(value).to_company_data() if value is not None else None
+               for name_key, value in changes.items()}
+    for listener in _change_listeners:
+        try:
+            listener(changed)
+        except Exception:
+            logger.exception("Stored data change listener failed")
+
+
+def _load_shared_records(backend: CompanyStorageBackend, shared_cache: SharedCache,
+                         name_keys: list[str]) -> dict[str, CompanyRecord | None]:
+    version = _local_records.version
+    records = {}
+    missing = []
+    for name_key in name_keys:
+        found, record = _local_records.get(version, name_key)
+        if found:
+            records[name_key] = record
+        else:
+            missing.append(name_key)
+    if not missing:
+        return records
+
+    cached = shared_cache.get_many(STORED_DATA_NAMESPACE, missing)
+    loaded = {name_key: CompanyRecord.from_json(value) for name_key, value in cached.items()}
+    if len(loaded) < len(missing):
+        # a miss means the company doesn't exist, unless another worker invalidated the cache meanwhile
+        all_records = {}
+        if not shared_cache.is_loaded(STORED_DATA_NAMESPACE):
+            all_records = _load_shared_namespace(backend, shared_cache)
+        loaded.update({name_key: all_records.get(name_key) for name_key in missing if name_key not in loaded})
+    for name_key, record in loaded.items():
+        _local_records.set(version, name_key, record)
+    records.update(loaded)
+    return records
+
+
+def _load_shared_namespace(backend: CompanyStorageBackend, shared_cache: SharedCache) -> dict[str, CompanyRecord]:
+    global _shared_stored_data_too_large
 
-    return None
+    # the first worker to miss loads every company in one pass, rather than each worker building its own index
+    generation = shared_cache.generation(STORED_DATA_NAMESPACE)
+    records = dict(backend.scan())
+    if len(records) > shared_cache.max_entries:
+        logger.warning("Stored data has %s companies, more than the %s the shared cache holds; "
+                       "using a per worker index instead", len(records), shared_cache.max_entries)
+        _shared_stored_data_too_large = True
+    else:
+        shared_cache.load(STORED_DATA_NAMESPACE, {key: record.to_json() for key, record in records.items()},
+                          generation)
+    return records
 
 
 def parse_company_data(company_data: dict) -> CompanyData:
@@ -0,0 +1,231 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from src.models import CompanyData, CompanyRecord
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# fraction of max_disk_bytes the disk tier is trimmed to, so a full tier isn't rescanned on every write
+DISK_EVICTION_TARGET = 0.9
+
+
+def hash_pdf_file(pdf_file) -> str | None:
+    """
+    Return the sha256 hex digest of a pdf file's contents, reading it in chunks.
+    The file position is restored afterwards so the file can still be read by the extractor.
+
+    :param pdf_file: UploadFile or binary file object
+    :return: hex digest, or None if pdf_file is not readable
+    """
+    stream = getattr(pdf_file, "file", pdf_file)
+    if not hasattr(stream, "read") or not hasattr(stream, "seek"):
+        return None
+
+    position = stream.tell()
+    stream.seek(0)
+    hasher = hashlib.sha256()
+    while chunk := stream.read(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    stream.seek(position)
+
+    return hasher.hexdigest()
+
+
+def extraction_cache_key(company_name: str, pdf_digest: str) -> str:
+    """
+    Build the cache key for an extraction.
+    The mocked pdf service picks its output by company name rather than file contents, so both are part of the key.
+
+    :param company_name: name of company
+    :param pdf_digest: digest of pdf contents, see hash_pdf_file
+    :return: cache key
+    """
+    return hashlib.sha256(f"{company_name.lower()}\0{pdf_digest}".encode()).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Two tier cache of extracted CompanyData keyed by extraction_cache_key.
+
+    The memory tier is an LRU holding up to max_entries CompanyRecords, so hits skip validation. The optional disk
+    tier stores one json file per entry under disk_location; entries older than ttl seconds are treated as missing,
+    and the oldest entries are evicted once the tier grows past max_disk_bytes. Disk hits are promoted back into
+    memory. Failing to write to the disk tier (e.g. a full disk) is logged and only costs a later miss.
+
+    The size of the disk tier is counted as entries are written, and the directory only rescanned once the count
+    goes over max_disk_bytes (or on the first write). Writes by other processes are picked up by the rescan.
+    """
+
+    def __init__(self, max_entries: int, disk_location: str | None = None, ttl: float | None = None,
+                 max_disk_bytes: int | None = None):
+        self.max_entries = max_entries
+        self.disk_location = disk_location
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, CompanyRecord]] = OrderedDict()
+        self._disk_bytes: int | None = None
+        self._lock = threading.Lock()
+        if disk_location:
+            os.makedirs(disk_location, exist_ok=True)
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def get(self, key: str) -> CompanyData | None:
+        """
+        Fetch cached extraction. Return None on a miss.
+
+        :param key: cache key
+        :return: CompanyData object if cached, otherwise None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, record = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return record.to_company_data()
+                del self._entries[key]
+
+        created, company_data = self._read_disk(key)
+        with self._lock:
+            if company_data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, created, company_data)
+        return company_data
+
+    def set(self, key: str, company_data: CompanyData):
+        """
+        Store an extraction in both tiers.
+
+        :param key: cache key
+        :param company_data: extracted CompanyData object
+        """
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, company_data)
+        self._write_disk(key, company_data)
+
+    def clear(self):
+        """
+        Drop all entries from both tiers and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.disk_hits = self.misses = 0
+            self._disk_bytes = None
+        for path, _, _ in self._disk_entries():
+            self._remove(path)
+
+    def stats(self) -> dict:
+        """
+        Return hit/miss counters and current size of the memory tier.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def _remember(self, key: str, created: float, company_data: CompanyData):
+        self._entries[key] = (created, CompanyRecord.from_company_data(company_data))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_location, f"{key}.json")
+
+    def _read_disk(self, key: str) -> tuple[float, CompanyData | None]:
+        if not self.disk_location:
+            return 0.0, None
+        path = self._path(key)
+        try:
+            created = os.path.getmtime(path)
+            if self._expired(created):
+                self._remove(path)
+                return 0.0, None
+            with open(path, "rb") as f:
+                return created, CompanyData.model_validate_json(f.read())
+        except (OSError, ValueError):
+            return 0.0, None
+
+    def _write_disk(self, key: str, company_data: CompanyData):
+        if not self.disk_location:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        data = company_data.model_dump_json(by_alias=True).encode()
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            # rename so readers never see a partially written entry
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.warning("Could not write extraction cache entry %s", path, exc_info=True)
+            self._remove(tmp_path)
+            return
+
+        if self.max_disk_bytes is None:
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data)
+            full = self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes
+        if full:
+            self._evict_disk()
+
+    def _disk_entries(self) -> list[tuple[str, float, int]]:
+        if not self.disk_location:
+            return []
+        entries = []
+        try:
+            with os.scandir(self.disk_location) as it:
+                for entry in it:
+                    if entry.name.endswith(".json"):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((entry.path, stat.st_mtime, stat.st_size))
+        except OSError:
+            logger.warning("Could not list extraction cache directory %s", self.disk_location, exc_info=True)
+        return entries
+
+    def _evict_disk(self):
+        entries = self._disk_entries()
+        total_size = sum(size for _, _, size in entries)
+        if total_size > self.max_disk_bytes:
+            target_size = self.max_disk_bytes * DISK_EVICTION_TARGET
+            for path, _, size in sorted(entries, key=lambda e: e[1]):
+                if total_size <= target_size:
+                    break
+                self._remove(path)
+                total_size -= size
+        with self._lock:
+            self._disk_bytes = total_size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,36 +1,345 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
-from src.config import settings
-from src.data_layer import load_company_data
-from src.data_discrepancy_checker import validate_company_data
-from src.pdf_service_api import extract_and_parse_pdf_data
-from src.models import DataDiscrepancyCheckerResponse
+import asyncio
+import logging
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import ValidationError
+from src.config import get_settings
+from src.data_layer import load_company_data, load_many_company_data, close_storage_backend, refresh_stored_data
+from src.data_discrepancy_checker import get_comparators, validate_company_data
+from src.pdf_service_api import extract_and_parse_pdf_data, extraction_client, pdf_service_pool
+from src.extraction_cache import hash_pdf_file
+from src.metrics import registry, stage_timer, track_request
+from src.pre_extraction import pre_extraction_worker
+from src.projections import ResponseProjection, ResponseView, get_projection
+from src.revalidation import validation_results
+from src.shared_cache import close_shared_cache
+from src.single_flight import SingleFlight
+from src.storage import normalize_company_name
+from src.uploads import UploadSizeLimitMiddleware, UploadTooLargeError, receive_pdf_upload
+from src.models import CompanyData, DataDiscrepancyCheckerResponse, BatchValidationResult
 
-app = FastAPI(debug=settings.debug)
+logger = logging.getLogger(__name__)
+
+# coalesces concurrent validations of the same company and pdf contents
+validation_flights = SingleFlight("validation")
+# request metrics path label for requests that match no route
+UNMATCHED_PATH = "unmatched"
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # compile the comparison rules up front, so bad COMPARISON_IGNORE_FIELDS stop startup instead of failing requests
+    get_comparators()
+    pdf_service_pool.open()
+    pre_extraction_worker.start()
+    refresher = None
+    refresh_interval = get_settings().stored_data_refresh_interval
+    if refresh_interval:
+        refresher = asyncio.create_task(_refresh_stored_data_periodically(refresh_interval))
+    yield
+    if refresher is not None:
+        refresher.cancel()
+    pre_extraction_worker.stop()
+    extraction_client.close()
+    pdf_service_pool.close()
+    close_storage_backend()
+    close_shared_cache()
+
+
+async def _refresh_stored_data_periodically(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(refresh_stored_data)
+        except Exception:
+            logger.exception("Failed to refresh stored data")
+
+
+def _upload_limit(path: str) -> int | None:
+    if path in ("/company/validate-pdf-data", "/company/validate-pdf-data/upload"):
+        return get_settings().max_upload_bytes
+    if path.startswith("/company/validate-pdf-data/"):
+        return get_settings().max_batch_upload_bytes
+    return None
+
+
+app = FastAPI(debug=get_settings().debug, lifespan=lifespan)
+app.add_middleware(UploadSizeLimitMiddleware, limit_for_path=_upload_limit)
+
+
+@app.exception_handler(UploadTooLargeError)
+async def upload_too_large(_request: Request, ex: UploadTooLargeError):
+    return JSONResponse(content={"error": ex.detail}, status_code=ex.status_code)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Time validation requests and log a stage breakdown for slow ones.
+    Streamed responses are timed until the response starts, not until the last line is sent.
+    """
+    if not request.url.path.startswith("/company/"):
+        return await call_next(request)
+
+    with track_request(UNMATCHED_PATH, slow_threshold=get_settings().slow_request_threshold) as outcome:
+        try:
+            response = await call_next(request)
+        finally:
+            # label by route template rather than raw path, so clients can't create new time series at will
+            route = request.scope.get("route")
+            if route is not None:
+                outcome["path"] = route.path
+        outcome["status"] = response.status_code
+    return response
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Expose request, stage and cache metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+def health():
+    """
+    Report status of the pdf service client pool. Returns 503 if the pool is unhealthy.
+    """
+    pool_status = pdf_service_pool.health_check()
+    return JSONResponse(content={"pdf_service_pool": pool_status},
+                        status_code=200 if pool_status["healthy"] else 503)
 
 
 @app.post("/company/validate-pdf-data", response_model=DataDiscrepancyCheckerResponse, response_model_by_alias=False)
-def validate_pdf_company_data(company_name: str, data_file: UploadFile = File(...)):
+async def validate_pdf_company_data(company_name: str, data_file: UploadFile = File(...),
+                                    view: ResponseView = ResponseView.full, fields: list[str] | None = Query(None)):
     """
     Take company name and a pdf with company data and validate the data against stored data.
     Returns extracted pdf data, stored data, and list of mismatched fields.
+    view=mismatches returns only the mismatched fields and view=summary only a ValidationSummary.
+    fields (repeatable) limits the company data and mismatches to the given CompanyData fields.
 
     :param company_name: company name
     :param data_file: pdf containing company data
-    :return: json response with format matching DataDiscrepancyCheckerResponse
+    :param view: full, mismatches or summary
+    :param fields: CompanyData field names to return, default all
+    :return: json response with format matching DataDiscrepancyCheckerResponse, or the requested view of it
     """
     # strip any spaces to ensure we find the company file and data
     company_name = company_name.strip()
 
-    stored_data = load_company_data(company_name)
+    try:
+        projection = get_projection(view, frozenset(fields) if fields else None)
+    except ValueError as ex:
+        return JSONResponse(content={"error": ex.args[0]}, status_code=400)
+
+    stored_data = await run_in_threadpool(load_company_data, company_name)
+    if not stored_data:
+        return JSONResponse(content={"error": "No data found for this company name."}, status_code=400)
+
+    try:
+        validated_response = await _extract_and_validate(company_name, stored_data, data_file)
+    except FileNotFoundError as ex:
+        return JSONResponse(content={"error": ex.args[0]}, status_code=400)
+    except asyncio.TimeoutError:
+        return JSONResponse(content={"error": "PDF extraction timed out."}, status_code=504)
+
+    return _projected_response(projection, validated_response)
+
+
+@app.post("/company/validate-pdf-data/upload", response_model=DataDiscrepancyCheckerResponse,
+          response_model_by_alias=False)
+async def validate_pdf_company_data_upload(company_name: str, request: Request, view: ResponseView = ResponseView.full,
+                                           fields: list[str] | None = Query(None)):
+    """
+    Streaming version of validate-pdf-data taking the pdf as the raw request body (e.g. Content-Type: application/pdf)
+    rather than a multipart form. The pdf is hashed as it arrives and only spooled to disk once large, and the
+    spooled file and digest are handed straight to extraction. Bodies over MAX_UPLOAD_BYTES are rejected with 413.
+    Takes the same view and fields options as validate-pdf-data.
+
+    :param company_name: company name
+    :param request: request whose body is the pdf
+    :param view: full, mismatches or summary
+    :param fields: CompanyData field names to return, default all
+    :return: json response with format matching DataDiscrepancyCheckerResponse, or the requested view of it
+    """
+    company_name = company_name.strip()
+
+    try:
+        projection = get_projection(view, frozenset(fields) if fields else None)
+    except ValueError as ex:
+        return JSONResponse(content={"error": ex.args[0]}, status_code=400)
+
+    # look the company up first, so unknown companies are rejected before the body is read
+    stored_data = await run_in_threadpool(load_company_data, company_name)
     if not stored_data:
         return JSONResponse(content={"error": "No data found for this company name."}, status_code=400)
 
+    upload = await receive_pdf_upload(request.stream(), spool_max_bytes=get_settings().upload_spool_max_bytes)
     try:
-        extracted_data = extract_and_parse_pdf_data(company_name=company_name, pdf_file=data_file)
+        if not upload.size:
+            return JSONResponse(content={"error": "No pdf data uploaded."}, status_code=400)
+        validated_response = await _extract_and_validate(company_name, stored_data, upload.pdf_file,
+                                                         pdf_digest=upload.pdf_digest)
     except FileNotFoundError as ex:
         return JSONResponse(content={"error": ex.args[0]}, status_code=400)
+    except asyncio.TimeoutError:
+        return JSONResponse(content={"error": "PDF extraction timed out."}, status_code=504)
+    finally:
+        upload.close()
+
+    return _projected_response(projection, validated_response)
+
+
+@app.get("/company/validation-results", response_model=list[BatchValidationResult], response_model_by_alias=False)
+async def get_validation_results():
+    """
+    Return the latest validation result per company. Changes to the stored data are picked up first, and only the
+    companies whose stored data changed are re-validated.
+
+    :return: json response with a list of BatchValidationResult
+    """
+    await run_in_threadpool(refresh_stored_data)
+    await run_in_threadpool(validation_results.wait)
+    return [BatchValidationResult(company_name=company_name, result=result)
+            for company_name, result in validation_results.results().items()]
+
+
+@app.post("/company/validate-pdf-data/batch", response_model=list[BatchValidationResult],
+          response_model_by_alias=False)
+async def validate_pdf_company_data_batch(company_names: list[str] = Query(...),
+                                          data_files: list[UploadFile] = File(...)):
+    """
+    Take a list of company names and a pdf for each, and validate every pdf against stored data.
+    Company names and files are paired by position. Errors for individual items are returned inline.
+
+    :param company_names: company names, one per file
+    :param data_files: pdfs containing company data
+    :return: json response with a list of BatchValidationResult
+    """
+    if len(company_names) != len(data_files):
+        return JSONResponse(content={"error": "Expected one company name per file."}, status_code=400)
+
+    company_names = [company_name.strip() for company_name in company_names]
+    stored_data = await run_in_threadpool(load_many_company_data, company_names)
+
+    return await asyncio.gather(*(
+        _validate_batch_item(company_name, stored_data[company_name], data_file)
+        for company_name, data_file in zip(company_names, data_files)
+    ))
+
+
+@app.post("/company/validate-pdf-data/stream")
+async def validate_pdf_company_data_stream(company_names: list[str] = Query(...),
+                                           data_files: list[UploadFile] = File(...),
+                                           mismatches_only: bool = False):
+    """
+    Streaming version of the batch endpoint for large runs. Writes one json line (NDJSON) per company as soon as
+    its validation finishes, so results arrive in completion order rather than request order.
+
+    :param company_names: company names, one per file
+    :param data_files: pdfs containing company data
+    :param mismatches_only: leave uploaded_data and stored_data out of each result
+    :return: streamed application/x-ndjson response with one BatchValidationResult per line
+    """
+    if len(company_names) != len(data_files):
+        return JSONResponse(content={"error": "Expected one company name per file."}, status_code=400)
+
+    company_names = [company_name.strip() for company_name in company_names]
+    stored_data = await run_in_threadpool(load_many_company_data, company_names)
+    exclude = {"result": {"uploaded_data", "stored_data"}} if mismatches_only else None
+    # uploads are closed as soon as this handler returns, before the response is streamed, so keep our own copies
+    pdf_files = [await run_in_threadpool(_copy_upload, data_file) for data_file in data_files]
+
+    async def validation_lines():
+        tasks = [asyncio.ensure_future(_validate_batch_item(company_name, stored_data[company_name], pdf_file))
+                 for company_name, pdf_file in zip(company_names, pdf_files)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                batch_result = await next_result
+                yield batch_result.model_dump_json(exclude=exclude) + "\n"
+        finally:
+            # stop outstanding validations if the client disconnects part way through
+            for task in tasks:
+                task.cancel()
+            for pdf_file in pdf_files:
+                pdf_file.close()
+
+    return StreamingResponse(validation_lines(), media_type="application/x-ndjson")
+
+
+def _projected_response(projection: ResponseProjection, validated_response: DataDiscrepancyCheckerResponse) -> Response:
+    # encoded here rather than through response_model, which would validate the response again before encoding it
+    with stage_timer("serialize_response"):
+        content = projection.to_json(validated_response)
+    return Response(content=content, media_type="application/json")
+
+
+def _copy_upload(data_file: UploadFile) -> tempfile.SpooledTemporaryFile:
+    pdf_file = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    data_file.file.seek(0)
+    shutil.copyfileobj(data_file.file, pdf_file)
+    pdf_file.seek(0)
+    return pdf_file
+
+
+async def _validate_batch_item(company_name: str, stored_data: CompanyData | None,
+                               data_file) -> BatchValidationResult:
+    if not stored_data:
+        return BatchValidationResult(company_name=company_name, error="No data found for this company name.")
+
+    try:
+        validated_response = await _extract_and_validate(company_name, stored_data, data_file)
+    except FileNotFoundError as ex:
+        return BatchValidationResult(company_name=company_name, error=ex.args[0])
+    except asyncio.TimeoutError:
+        return BatchValidationResult(company_name=company_name, error="PDF extraction timed out.")
+    except ValidationError:
+        logger.exception("Extracted data for %s is invalid", company_name)
+        return BatchValidationResult(company_name=company_name, error="Extracted pdf data is invalid.")
+    except Exception:
+        # one failing item shouldn't fail the whole batch or cut a stream short
+        logger.exception("Validating %s failed", company_name)
+        return BatchValidationResult(company_name=company_name, error="Validation failed.")
+
+    return BatchValidationResult(company_name=company_name, result=validated_response)
+
+
+async def _extract_and_validate(company_name: str, stored_data: CompanyData, pdf_file,
+                                pdf_digest: str | None = None) -> DataDiscrepancyCheckerResponse:
+    """
+    Extract a pdf and validate it against stored data. Concurrent calls for the same company and pdf contents
+    share a single extraction and comparison.
+    Raises FileNotFoundError if the pdf can't be extracted and asyncio.TimeoutError if extraction times out.
+    """
+    if pdf_digest is None:
+        with stage_timer("hash_pdf"):
+            pdf_digest = await run_in_threadpool(hash_pdf_file, pdf_file)
+    if pdf_digest is None:
+        return await _run_extract_and_validate(company_name, stored_data, pdf_file, pdf_digest)
+
+    # joining callers are served from the first caller's pdf file, which has identical contents
+    return await validation_flights.run((normalize_company_name(company_name), pdf_digest),
+                                        _run_extract_and_validate, company_name, stored_data, pdf_file, pdf_digest)
+
+
+async def _run_extract_and_validate(company_name: str, stored_data: CompanyData, pdf_file,
+                                    pdf_digest: str | None) -> DataDiscrepancyCheckerResponse:
+    extracted_data = await extraction_client.run(extract_and_parse_pdf_data, company_name=company_name,
+                                                 pdf_file=pdf_file, pdf_digest=pdf_digest)
+    return _validate(company_name, extracted_data=extracted_data, stored_data=stored_data)
 
-    validated_response = validate_company_data(extracted_data=extracted_data, stored_data=stored_data)
 
+def _validate(company_name: str, extracted_data: CompanyData,
+              stored_data: CompanyData) -> DataDiscrepancyCheckerResponse:
+    # reuse the previous result if neither side changed, and keep new results for re-validation on data changes
+    validated_response = validation_results.get_unchanged(company_name, extracted_data, stored_data)
+    if validated_response is None:
+        validated_response = validate_company_data(extracted_data=extracted_data, stored_data=stored_data)
+        validation_results.record(company_name, extracted_data, stored_data, validated_response)
     return validated_response
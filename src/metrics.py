@@ -0,0 +1,209 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# per-request stage timings, set while a request is being tracked
+_request_stages: ContextVar[dict[str, float] | None] = ContextVar("request_stages", default=None)
+
+
+def _escape_label_value(value: str) -> str:
+    # as required by the text format, so a label value can't break out of its quotes
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple[str, ...], labelvalues: tuple[str, ...], extra: str = "") -> str:
+    labels = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Metric:
+    """
+    Base class for metrics with optional labels, rendered in the Prometheus text format.
+    """
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return super().render() + [f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+                                   for labels, value in values.items()]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, *labelvalues: str, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    @contextmanager
+    def track_in_progress(self, *labelvalues: str):
+        """
+        Increment the gauge for the duration of the with block.
+        """
+        self.inc(*labelvalues)
+        try:
+            yield
+        finally:
+            self.dec(*labelvalues)
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # per label values: count per bucket (last one is +Inf), sum, count
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        with self._lock:
+            bucket_counts, total = self._values.setdefault(labelvalues, ([0] * (len(self.buckets) + 1), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[i] += 1
+                    break
+            else:
+                bucket_counts[-1] += 1
+            total[0] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = {labels: (list(counts), total[0]) for labels, (counts, total) in self._values.items()}
+        lines = super().render()
+        for labels, (bucket_counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), bucket_counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Collection of metrics plus callbacks that refresh gauges (e.g. cache hit ratios) just before rendering.
+    """
+
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        self.collectors: list[Callable[[], None]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+        for collector in self.collectors:
+            collector()
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram("validation_stage_seconds",
+                                            "Time spent in each stage of the validation pipeline.", ["stage"]))
+request_seconds = registry.register(Histogram("validation_request_seconds",
+                                              "Time spent handling validation requests.", ["path"]))
+requests_total = registry.register(Counter("validation_requests_total",
+                                           "Validation requests handled.", ["path", "status"]))
+requests_in_flight = registry.register(Gauge("validation_requests_in_flight",
+                                             "Validation requests currently being handled."))
+extractions_in_flight = registry.register(Gauge("pdf_extractions_in_flight",
+                                                "PDF extractions currently running against the pdf service."))
+extraction_cache_lookups = registry.register(Gauge("extraction_cache_lookups",
+                                                   "Extraction cache lookups by result.", ["result"]))
+extraction_cache_hit_ratio = registry.register(Gauge("extraction_cache_hit_ratio",
+                                                     "Share of extraction cache lookups that were hits."))
+coalesced_calls = registry.register(Counter("coalesced_calls_total",
+                                           "Calls that joined an identical call already in flight.", ["name"]))
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Time the with block as one stage of the validation pipeline. The timing is added to the stage histogram and,
+    if a request is being tracked, to that request's stage breakdown.
+
+    :param stage: stage name
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+
+
+@contextmanager
+def track_request(path: str, slow_threshold: float):
+    """
+    Track a request: count it as in flight, time it and collect its stage timings.
+    Requests taking longer than slow_threshold seconds log their stage breakdown.
+
+    :param path: path label, e.g. a route template. Use bounded values, every distinct path is a new time series
+    :param slow_threshold: seconds above which a request is logged as slow
+    :return: context manager yielding a dict the caller can set "status" on, and "path" to relabel the request
+    """
+    stages: dict[str, float] = {}
+    token = _request_stages.set(stages)
+    outcome = {"status": "error", "path": path}
+    start = time.perf_counter()
+    try:
+        with requests_in_flight.track_in_progress():
+            yield outcome
+    finally:
+        elapsed = time.perf_counter() - start
+        _request_stages.reset(token)
+        path = outcome["path"]
+        request_seconds.observe(elapsed, path)
+        requests_total.inc(path, str(outcome["status"]))
+        if elapsed > slow_threshold:
+            breakdown = ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in stages.items())
+            logger.warning("Slow request %s took %.1fms: %s", path, elapsed * 1000, breakdown or "no stages recorded")
@@ -1,5 +1,7 @@
+import json
+import operator
 from decimal import Decimal
-from typing import Any, Optional
+from typing import Any, Literal, Optional, get_args
 from pydantic import BaseModel, Field, ConfigDict
 
 
@@ -33,6 +35,66 @@ class CompanyData(BaseModel):
     )
 
 
+class CompanyRecord:
+    """
+    Compact copy of an already validated CompanyData, held by stores and caches.
+
+    to_company_data builds a CompanyData directly from the stored values without re-running validation, so records
+    must only ever be created from validated data (see from_company_data).
+    """
+    __slots__ = ("values", "fields_set")
+
+    _fields = tuple(CompanyData.model_fields)
+    _get_values = operator.attrgetter(*_fields)
+    _decimal_columns = tuple(column for column, info in enumerate(CompanyData.model_fields.values())
+                             if Decimal in (info.annotation, *get_args(info.annotation)))
+    # most records share the same set of provided fields, so keep one copy of each
+    _interned_fields_sets: dict[frozenset[str], frozenset[str]] = {}
+
+    def __init__(self, values: tuple, fields_set: frozenset[str]):
+        self.values = values
+        self.fields_set = fields_set
+
+    @classmethod
+    def from_company_data(cls, company_data: CompanyData) -> "CompanyRecord":
+        """
+        Create a record from a validated CompanyData object.
+        """
+        fields_set = frozenset(company_data.model_fields_set)
+        return cls(cls._get_values(company_data), cls._interned_fields_sets.setdefault(fields_set, fields_set))
+
+    def to_json(self) -> str:
+        """
+        Encode the record as json, e.g. for a cache shared between processes. Decimals are written as strings so
+        they round trip exactly.
+        """
+        return json.dumps([self.values, sorted(self.fields_set)], default=str)
+
+    @classmethod
+    def from_json(cls, data: str | bytes) -> "CompanyRecord":
+        """
+        Decode a record encoded by to_json. Only use on the output of to_json, the values are not validated again.
+        """
+        values, fields_set = json.loads(data)
+        for column in cls._decimal_columns:
+            if values[column] is not None:
+                values[column] = Decimal(values[column])
+        fields_set = frozenset(fields_set)
+        return cls(tuple(values), cls._interned_fields_sets.setdefault(fields_set, fields_set))
+
+    def to_company_data(self) -> CompanyData:
+        """
+        Build a new CompanyData object from the record, skipping validation.
+        """
+        # same state a validated instance has, see BaseModel.model_construct/model_copy
+        company_data = object.__new__(CompanyData)
+        object.__setattr__(company_data, "__dict__", dict(zip(self._fields, self.values)))
+        object.__setattr__(company_data, "__pydantic_fields_set__", set(self.fields_set))
+        object.__setattr__(company_data, "__pydantic_extra__", None)
+        object.__setattr__(company_data, "__pydantic_private__", None)
+        return company_data
+
+
 class MismatchedFields(BaseModel):
     field_name: str
     uploaded_value: Any
@@ -57,3 +119,21 @@ class DataDiscrepancyCheckerResponse(BaseModel):
         FIXME - this works but I am not sure why it was failing in the first place.
         """
         return vars(self) == vars(other)
+
+
+class BatchValidationResult(BaseModel):
+    """
+    Result of validating a single item in a batch. Exactly one of result and error is set.
+    """
+    company_name: str
+    result: Optional[DataDiscrepancyCheckerResponse] = None
+    error: Optional[str] = None
+
+
+class ValidationSummary(BaseModel):
+    """
+    Compact validation result: whether the uploaded data matched, and the names of any mismatched fields.
+    """
+    company_name: str
+    status: Literal["match", "mismatch"]
+    mismatched_fields: list[str]
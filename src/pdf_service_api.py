@@ -1,22 +1,287 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from src.extraction_cache import ExtractionCache, extraction_cache_key, hash_pdf_file
 from src.pdf_service import PdfService
 from src.models import CompanyData
-from src.config import settings
+from src.config import get_settings
+from src.shared_cache import EXTRACTION_NAMESPACE, get_shared_cache
+from src.metrics import extractions_in_flight, extraction_cache_lookups, extraction_cache_hit_ratio, registry, \
+    stage_timer
 
 
-def extract_and_parse_pdf_data(company_name: str, pdf_file) -> CompanyData:
+class PdfServicePool:
+    """
+    Pool of authenticated PdfService clients reused across requests, so each extraction doesn't pay for
+    authentication and connection setup.
+
+    Clients are created on demand up to max_size. Idle clients that fail the health check are discarded and
+    replaced. The pool is opened and closed with the app lifespan, but also works without it (e.g. in scripts).
+    """
+
+    def __init__(self, key: str, max_size: int, timeout: float | None = None):
+        self.key = key
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle: list[PdfService] = []
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def acquire(self):
+        """
+        Check out a client for the duration of the with block. Raises asyncio.TimeoutError if no client is free
+        within the pool timeout.
+
+        :return: context manager yielding a PdfService
+        """
+        client = self._checkout()
+        try:
+            yield client
+        finally:
+            self._checkin(client)
+
+    def is_healthy(self, client: PdfService) -> bool:
+        """
+        Check a client is still usable. The mocked service has no ping, so only its credentials are checked.
+        """
+        return client.key == self.key
+
+    def health_check(self) -> dict:
+        """
+        Return pool status, discarding any idle clients that fail the health check.
+        """
+        with self._condition:
+            unhealthy = [client for client in self._idle if not self.is_healthy(client)]
+            for client in unhealthy:
+                self._discard(client)
+            return {
+                "healthy": not self._closed,
+                "size": self._size,
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+                "discarded": len(unhealthy),
+            }
+
+    def open(self):
+        """
+        Allow clients to be checked out. Pools start open; this re-opens a closed pool.
+        """
+        with self._condition:
+            self._closed = False
+
+    def close(self):
+        """
+        Close all idle clients and refuse new checkouts. Clients still in use are closed when returned.
+        """
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle[-1])
+            self._condition.notify_all()
+
+    def _checkout(self) -> PdfService:
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("PdfService pool is closed.")
+                while self._idle:
+                    client = self._idle.pop()
+                    if self.is_healthy(client):
+                        return client
+                    self._close_client(client)
+                    self._size -= 1
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                if not self._condition.wait(self.timeout):
+                    # asyncio's TimeoutError, the one routes handle, is a separate class before Python 3.11
+                    raise asyncio.TimeoutError("Timed out waiting for a PdfService client.")
+
+        try:
+            return PdfService(key=self.key)
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def _checkin(self, client: PdfService):
+        with self._condition:
+            if self._closed or not self.is_healthy(client):
+                self._close_client(client)
+                self._size -= 1
+            else:
+                self._idle.append(client)
+            self._condition.notify()
+
+    def _discard(self, client: PdfService):
+        self._idle.remove(client)
+        self._close_client(client)
+        self._size -= 1
+
+    @staticmethod
+    def _close_client(client: PdfService):
+        # the mocked service holds no connection, but a real client would be closed here
+        close = getattr(client, "close", None)
+        if close is not None:
+            close()
+
+
+def _create_pdf_service_pool() -> PdfServicePool:
+    settings = get_settings()
+    return PdfServicePool(key=settings.api_key, max_size=settings.pdf_service_pool_max_size,
+                          timeout=settings.pdf_service_pool_timeout)
+
+
+def _create_extraction_cache() -> ExtractionCache:
+    settings = get_settings()
+    return ExtractionCache(max_entries=settings.extraction_cache_max_entries,
+                           disk_location=settings.extraction_cache_dir,
+                           ttl=settings.extraction_cache_ttl,
+                           max_disk_bytes=settings.extraction_cache_max_disk_bytes)
+
+
+pdf_service_pool = _create_pdf_service_pool()
+extraction_cache = _create_extraction_cache()
+
+
+def _collect_extraction_cache_stats():
+    stats = extraction_cache.stats()
+    for result in ("memory_hits", "disk_hits", "misses"):
+        extraction_cache_lookups.set(stats[result], result)
+    extraction_cache_hit_ratio.set(stats["hit_ratio"])
+
+
+registry.add_collector(_collect_extraction_cache_stats)
+
+
+def extract_and_parse_pdf_data(company_name: str, pdf_file, pdf_digest: str | None = None) -> CompanyData:
     """
     Calls PdfService to extract data from pdf file corresponding to comp
+    Results are cached by pdf contents, so repeat uploads of the same file skip the pdf service. If a shared cache
+    is configured, extractions made by other worker processes are reused too.
 
     :param company_name: name of company
     :param pdf_file: pdf file to extract
+    :param pdf_digest: digest of pdf contents if already known (e.g. hashed while streaming the upload)
     :return: CompanyData object containing extracted data
     """
 
+    if pdf_digest is None:
+        with stage_timer("hash_pdf"):
+            pdf_digest = hash_pdf_file(pdf_file)
+    cache_key = extraction_cache_key(company_name, pdf_digest) if pdf_digest else None
+    if cache_key:
+        with stage_timer("extraction_cache_lookup"):
+            cached_data = extraction_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
+
+    shared_cache = get_shared_cache() if cache_key else None
+    if shared_cache is not None:
+        with stage_timer("shared_cache_lookup"):
+            shared_data = shared_cache.get(EXTRACTION_NAMESPACE, cache_key)
+        if shared_data is not None:
+            company_data = CompanyData.model_validate_json(shared_data)
+            extraction_cache.set(cache_key, company_data)
+            return company_data
+        generation = shared_cache.generation(EXTRACTION_NAMESPACE)
+
     # this is a mocked service
-    pdfs = PdfService(key=settings.api_key)
+    with pdf_service_pool.acquire() as pdfs, stage_timer("pdf_extract"):
+        # realistically, we might want a db table containing records of uploaded company files with
+        # e.g. company_name, file_path, etc.
+        # ignoring pdf_file and parsing company_name directly into file path for simplicity.
+        extracted_company_data = (pdfs.extract(file_path=f"assets/{company_name.lower()}.pdf"))
+    with stage_timer("parse_extracted_data"):
+        company_data = CompanyData(**extracted_company_data)
+
+    if cache_key:
+        extraction_cache.set(cache_key, company_data)
+    if shared_cache is not None:
+        shared_cache.set(EXTRACTION_NAMESPACE, cache_key, company_data.model_dump_json(by_alias=True), generation)
+
+    return company_data
+
+
+class AsyncExtractionClient:
+    """
+    Runs blocking PdfService extractions on a dedicated worker pool so they can be awaited from async routes.
+
+    A semaphore caps the number of extractions in flight, so concurrency can be tuned against the pdf service's
+    rate limits independently of FastAPI's threadpool. Calls taking longer than the timeout raise TimeoutError;
+    note the worker thread itself cannot be interrupted and keeps running until the pdf service returns.
+    """
+
+    def __init__(self, max_concurrency: int, max_workers: int, timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+        # asyncio primitives are bound to a single event loop, so keep one semaphore per running loop
+        self._semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a blocking extraction function on the worker pool, subject to the concurrency limit and timeout.
+
+        :param func: blocking function to call, e.g. extract_and_parse_pdf_data
+        :return: result of func
+        """
+        loop = asyncio.get_running_loop()
+        # run in a copy of the current context so stage timings are attributed to the calling request
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        async with self._get_semaphore(loop):
+            with extractions_in_flight.track_in_progress():
+                future = loop.run_in_executor(self._get_executor(), call)
+                return await asyncio.wait_for(future, timeout=self.timeout)
+
+    async def extract(self, company_name: str, pdf_file, pdf_digest: str | None = None) -> CompanyData:
+        """
+        Awaitable version of extract_and_parse_pdf_data.
+
+        :param company_name: name of company
+        :param pdf_file: pdf file to extract
+        :param pdf_digest: digest of pdf contents if already known
+        :return: CompanyData object containing extracted data
+        """
+        return await self.run(extract_and_parse_pdf_data, company_name=company_name, pdf_file=pdf_file,
+                              pdf_digest=pdf_digest)
+
+    def close(self):
+        """
+        Shut down the worker pool. A new pool is started if the client is used again.
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pdf-extraction")
+            return self._executor
+
+    def _get_semaphore(self, loop: asyncio.AbstractEventLoop) -> asyncio.BoundedSemaphore:
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.BoundedSemaphore(self.max_concurrency)
+        return semaphore
+
+
+def _create_extraction_client() -> AsyncExtractionClient:
+    settings = get_settings()
+    return AsyncExtractionClient(max_concurrency=settings.extraction_max_concurrency,
+                                 max_workers=settings.extraction_workers,
+                                 timeout=settings.extraction_timeout)
+
 
-    # realistically, we might want a db table containing records of uploaded company files with
-    # e.g. company_name, file_path, etc.
-    # ignoring pdf_file and parsing company_name directly into file path for simplicity.
-    extracted_company_data = (pdfs.extract(file_path=f"assets/{company_name.lower()}.pdf"))
-    return CompanyData(**extracted_company_data)
+extraction_client = _create_extraction_client()
@@ -0,0 +1,147 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from src.config import get_settings
+from src.models import CompanyData
+from src.pdf_service_api import extract_and_parse_pdf_data
+
+logger = logging.getLogger(__name__)
+
+
+class PreExtractionWorker:
+    """
+    Extracts pdfs ahead of time, so interactive validations of the same files are served from the extraction cache
+    instead of waiting on the pdf service. Set EXTRACTION_CACHE_DIR to keep the results across restarts.
+
+    Pdfs are either enqueued directly or picked up from a watched directory, which is polled for new or changed
+    files. The company name is taken from the file name (e.g. healthinc.pdf), matching how extraction resolves files.
+    Failed extractions are retried with exponential backoff; FileNotFoundError from the pdf service means the file
+    can't be extracted at all and is not retried.
+    """
+
+    def __init__(self, workers: int, max_retries: int, backoff: float, watch_dir: str | None = None,
+                 poll_interval: float = 30.0):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.watch_dir = watch_dir
+        self.poll_interval = poll_interval
+        self.completed = 0
+        self.failed = 0
+        self._executor: ThreadPoolExecutor | None = None
+        self._watcher: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._seen: dict[str, tuple[int, int]] = {}
+        self._scan_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the worker pool and, if a watch directory is configured, queue the pdfs already in it and start
+        the directory watcher.
+        """
+        self._stopped.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pre-extraction")
+        if self.watch_dir:
+            self.scan()
+            self._watcher = threading.Thread(target=self._watch, name="pre-extraction-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        """
+        Stop watching and cancel queued extractions. Extractions already running are left to finish.
+        """
+        self._stopped.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def enqueue(self, pdf_path: str, company_name: str | None = None) -> Future:
+        """
+        Queue a pdf for extraction.
+
+        :param pdf_path: path to pdf file
+        :param company_name: name of company, defaults to the file name without extension
+        :return: future resolving to the extracted CompanyData
+        """
+        if self._executor is None:
+            raise RuntimeError("Pre-extraction worker is not running.")
+        company_name = company_name or os.path.splitext(os.path.basename(pdf_path))[0]
+        return self._executor.submit(self._extract, pdf_path, company_name)
+
+    def scan(self) -> list[Future]:
+        """
+        Queue every pdf in the watch directory that is new or has changed since the last scan.
+
+        :return: futures for the queued extractions
+        """
+        futures = []
+        with self._scan_lock, os.scandir(self.watch_dir) as it:
+            for entry in it:
+                if not entry.is_file() or not entry.name.lower().endswith(".pdf"):
+                    continue
+                stat = entry.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if self._seen.get(entry.path) != signature:
+                    self._seen[entry.path] = signature
+                    futures.append(self.enqueue(entry.path))
+        return futures
+
+    def stats(self) -> dict:
+        """
+        Return number of completed and failed extractions.
+        """
+        with self._lock:
+            return {"completed": self.completed, "failed": self.failed}
+
+    def _watch(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.scan()
+            except (OSError, RuntimeError):
+                logger.exception("Failed to scan %s for pdfs", self.watch_dir)
+
+    def _extract(self, pdf_path: str, company_name: str) -> CompanyData:
+        attempt = 0
+        while True:
+            try:
+                with open(pdf_path, "rb") as pdf_file:
+                    company_data = extract_and_parse_pdf_data(company_name=company_name, pdf_file=pdf_file)
+            except FileNotFoundError:
+                self._record_failure(pdf_path)
+                raise
+            except Exception:
+                if attempt >= self.max_retries or self._stopped.is_set():
+                    self._record_failure(pdf_path)
+                    raise
+                delay = self.backoff * 2 ** attempt
+                attempt += 1
+                logger.warning("Extraction of %s failed, retrying in %.1fs (attempt %d of %d)",
+                               pdf_path, delay, attempt, self.max_retries)
+                self._stopped.wait(delay)
+                continue
+
+            with self._lock:
+                self.completed += 1
+            return company_data
+
+    def _record_failure(self, pdf_path: str):
+        logger.exception("Extraction of %s failed", pdf_path)
+        with self._lock:
+            self.failed += 1
+
+
+def _create_pre_extraction_worker() -> PreExtractionWorker:
+    settings = get_settings()
+    return PreExtractionWorker(workers=settings.pre_extraction_workers,
+                               max_retries=settings.pre_extraction_max_retries,
+                               backoff=settings.pre_extraction_backoff,
+                               watch_dir=settings.pre_extraction_watch_dir,
+                               poll_interval=settings.pre_extraction_poll_interval)
+
+
+pre_extraction_worker = _create_pre_extraction_worker()
@@ -0,0 +1,72 @@
+from enum import Enum
+from functools import lru_cache
+from src.models import CompanyData, DataDiscrepancyCheckerResponse, ValidationSummary
+
+
+class ResponseView(str, Enum):
+    """
+    How much of a validation result to return.
+    """
+    full = "full"  # uploaded data, stored data and mismatched fields
+    mismatches = "mismatches"  # mismatched fields only
+    summary = "summary"  # match status and mismatched field names, see ValidationSummary
+
+
+class ResponseProjection:
+    """
+    Serializer for one view of a DataDiscrepancyCheckerResponse, optionally limited to some CompanyData fields.
+    The include spec is worked out once per projection, so each response is encoded straight to json by pydantic's
+    compiled serializer rather than being re-validated against a response model. The full view without fields gives
+    the same json as the response model.
+    """
+
+    def __init__(self, view: ResponseView, fields: frozenset[str] | None = None):
+        self.view = view
+        self.fields = fields
+        if view is ResponseView.mismatches:
+            self._include = {"mismatched_fields": True}
+        elif view is ResponseView.full and fields is not None:
+            self._include = {"uploaded_data": fields, "stored_data": fields, "mismatched_fields": True}
+        else:
+            self._include = None
+
+    def to_json(self, response: DataDiscrepancyCheckerResponse) -> bytes:
+        """
+        Encode a validation result.
+
+        :param response: validation result
+        :return: json
+        """
+        mismatched_fields = response.mismatched_fields
+        if self.fields is not None:
+            mismatched_fields = [mismatch for mismatch in mismatched_fields if mismatch.field_name in self.fields]
+
+        if self.view is ResponseView.summary:
+            summary = ValidationSummary.model_construct(
+                company_name=response.stored_data.company_name,
+                status="mismatch" if mismatched_fields else "match",
+                mismatched_fields=[mismatch.field_name for mismatch in mismatched_fields])
+            return summary.model_dump_json().encode()
+
+        if mismatched_fields is not response.mismatched_fields:
+            response = DataDiscrepancyCheckerResponse.model_construct(uploaded_data=response.uploaded_data,
+                                                                      stored_data=response.stored_data,
+                                                                      mismatched_fields=mismatched_fields)
+        return response.model_dump_json(include=self._include).encode()
+
+
+@lru_cache(maxsize=256)
+def get_projection(view: ResponseView, fields: frozenset[str] | None = None) -> ResponseProjection:
+    """
+    Return the serializer for a view and field selection, building it on first use.
+
+    :param view: response view
+    :param fields: CompanyData field names to keep, or None for all fields
+    :return: ResponseProjection
+    :raises ValueError: if any of the fields isn't a CompanyData field
+    """
+    if fields is not None:
+        unknown = sorted(fields - CompanyData.model_fields.keys())
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}.")
+    return ResponseProjection(view, fields)
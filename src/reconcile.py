@@ -0,0 +1,103 @@
+"""
+Offline reconciliation of extracted company data against stored data, without starting the web stack.
+
+Reads a directory of extracted data, one json file per pdf in the format returned by the pdf service (or CompanyData
+json), looks up the stored data for every company in one batch, compares them all in a single bulk pass and writes
+one json line per company in the same format as the streaming endpoint.
+
+Usage:
+    python -m src.reconcile data/database.csv extracted/
+    python -m src.reconcile data/database.csv extracted/ --mismatches-only --output report.ndjson --fail-on-mismatch
+"""
+import argparse
+import os
+import sys
+from pydantic import ValidationError
+from src.data_discrepancy_checker import get_bulk_mismatches
+from src.models import BatchValidationResult, CompanyData, DataDiscrepancyCheckerResponse
+from src.storage import create_backend
+
+
+def load_extracted_data(extracted_dir: str) -> tuple[dict[str, CompanyData], list[BatchValidationResult]]:
+    """
+    Parse every json file in a directory of extracted data.
+
+    :param extracted_dir: directory of json files
+    :return: extracted CompanyData keyed by file name, and error results for files that couldn't be parsed
+    """
+    extracted, errors = {}, []
+    for file_name in sorted(os.listdir(extracted_dir)):
+        if not file_name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(extracted_dir, file_name), "rb") as f:
+                extracted[file_name] = CompanyData.model_validate_json(f.read())
+        except (OSError, ValidationError) as ex:
+            errors.append(BatchValidationResult(company_name=os.path.splitext(file_name)[0],
+                                                error=f"Cannot read extracted data from {file_name}: {ex}"))
+    return extracted, errors
+
+
+def reconcile(db_location: str, extracted_dir: str) -> list[BatchValidationResult]:
+    """
+    Validate a directory of extracted data against stored data.
+
+    :param db_location: csv file path, snapshot file path or sqlite url, see storage.create_backend
+    :param extracted_dir: directory of json files containing extracted data
+    :return: one BatchValidationResult per file
+    """
+    extracted, results = load_extracted_data(extracted_dir)
+
+    backend = create_backend(db_location, pool_size=1)
+    try:
+        stored = backend.get_many([company_data.company_name for company_data in extracted.values()])
+    finally:
+        backend.close()
+
+    pairs = []
+    for company_data in extracted.values():
+        if stored[company_data.company_name] is None:
+            results.append(BatchValidationResult(company_name=company_data.company_name,
+                                                 error="No data found for this company name."))
+        else:
+            pairs.append((company_data, stored[company_data.company_name]))
+
+    matrix = get_bulk_mismatches([extracted_data for extracted_data, _ in pairs],
+                                 [stored_data for _, stored_data in pairs])
+    for row, (extracted_data, stored_data) in enumerate(pairs):
+        response = DataDiscrepancyCheckerResponse(uploaded_data=extracted_data, stored_data=stored_data,
+                                                  mismatched_fields=matrix.mismatched_fields(row))
+        results.append(BatchValidationResult(company_name=extracted_data.company_name, result=response))
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db_location", help="stored data: csv file, .snap snapshot or sqlite:///<path> url")
+    parser.add_argument("extracted_dir", help="directory of json files containing extracted data")
+    parser.add_argument("--mismatches-only", action="store_true",
+                        help="leave uploaded_data and stored_data out of each result")
+    parser.add_argument("--output", help="write results to this file (default stdout)")
+    parser.add_argument("--fail-on-mismatch", action="store_true",
+                        help="exit with code 1 if any company has mismatches or errors")
+    args = parser.parse_args(argv)
+
+    results = reconcile(args.db_location, args.extracted_dir)
+
+    exclude = {"result": {"uploaded_data", "stored_data"}} if args.mismatches_only else None
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for batch_result in results:
+            output.write(batch_result.model_dump_json(exclude=exclude) + "\n")
+    finally:
+        if args.output:
+            output.close()
+
+    failed = [batch_result for batch_result in results
+              if batch_result.error or batch_result.result.mismatched_fields]
+    print(f"Reconciled {len(results)} companies, {len(failed)} with mismatches or errors", file=sys.stderr)
+    return 1 if args.fail_on_mismatch and failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+from src.config import get_settings
+from src.data_discrepancy_checker import validate_company_data
+from src.data_layer import add_stored_data_listener
+from src.models import CompanyData, DataDiscrepancyCheckerResponse
+from src.storage import normalize_company_name
+
+logger = logging.getLogger(__name__)
+
+# called with the re-validated results, keyed by company name (None for companies no longer in the stored data)
+ResultListener = Callable[[dict[str, DataDiscrepancyCheckerResponse | None]], None]
+
+
+class _ValidationEntry:
+    __slots__ = ("company_name", "extracted_data", "stored_data", "response")
+
+    def __init__(self, company_name: str, extracted_data: CompanyData, stored_data: CompanyData,
+                 response: DataDiscrepancyCheckerResponse):
+        self.company_name = company_name
+        self.extracted_data = extracted_data
+        self.stored_data = stored_data
+        self.response = response
+
+
+class ValidationResultStore:
+    """
+    Latest extraction and validation result per company, keyed by normalised company name.
+
+    Validations whose extracted and stored data are both unchanged reuse the previous result. When stored data
+    changes (see data_layer.add_stored_data_listener), only the companies whose stored values changed are
+    re-validated on a background thread, and the new results are published to subscribers from that thread. Holds
+    up to max_entries companies, least recently validated dropped first.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.reused = 0
+        self.revalidated = 0
+        self._entries: OrderedDict[str, _ValidationEntry] = OrderedDict()
+        self._listeners: list[ResultListener] = []
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending: Future | None = None
+
+    def get_unchanged(self, company_name: str, extracted_data: CompanyData,
+                      stored_data: CompanyData) -> DataDiscrepancyCheckerResponse | None:
+        """
+        Return the previous result for a company if it was validated with the same extracted and stored data.
+
+        :param company_name: name of company
+        :param extracted_data: CompanyData object containing extracted pdf data
+        :param stored_data: CompanyData object containing stored data
+        :return: DataDiscrepancyCheckerResponse if unchanged, otherwise None
+        """
+        with self._lock:
+            entry = self._entries.get(normalize_company_name(company_name))
+            if entry is None or entry.extracted_data != extracted_data or entry.stored_data != stored_data:
+                return None
+            self.reused += 1
+            return entry.response
+
+    def record(self, company_name: str, extracted_data: CompanyData, stored_data: CompanyData,
+               response: DataDiscrepancyCheckerResponse):
+        """
+        Keep a validation result as the latest one for a company.
+        """
+        name_key = normalize_company_name(company_name)
+        with self._lock:
+            self._entries[name_key] = _ValidationEntry(company_name, extracted_data, stored_data, response)
+            self._entries.move_to_end(name_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stored_data_changed(self, changed: dict[str, CompanyData | None]):
+        """
+        Queue re-validation of the kept results affected by a change to stored data and return without waiting
+        for it. Changes are re-validated in the order they arrive, see wait().
+
+        :param changed: changed CompanyData (None for removed companies) keyed by normalised company name
+        """
+        with self._lock:
+            if not any(name_key in self._entries for name_key in changed):
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="revalidation")
+            self._pending = self._executor.submit(self._revalidate, changed)
+
+    def wait(self):
+        """
+        Wait for queued re-validations to finish.
+        """
+        pending = self._pending
+        if pending is not None:
+            pending.result()
+
+    def _revalidate(self, changed: dict[str, CompanyData | None]):
+        """
+        Re-validate the kept results affected by a change to stored data and publish them to subscribers.
+        Companies removed from the stored data are dropped.
+        """
+        with self._lock:
+            affected = [(name_key, self._entries[name_key], stored_data)
+                        for name_key, stored_data in changed.items()
+                        if name_key in self._entries and self._entries[name_key].stored_data != stored_data]
+        if not affected:
+            return
+
+        updated = {}
+        for name_key, entry, stored_data in affected:
+            response = None
+            if stored_data is not None:
+                try:
+                    response = validate_company_data(extracted_data=entry.extracted_data, stored_data=stored_data)
+                except Exception:
+                    logger.exception("Re-validating %s failed", entry.company_name)
+                    continue
+            with self._lock:
+                # skip entries replaced by a newer validation while we were re-validating
+                if self._entries.get(name_key) is not entry:
+                    continue
+                if response is None:
+                    del self._entries[name_key]
+                else:
+                    self._entries[name_key] = _ValidationEntry(entry.company_name, entry.extracted_data,
+                                                               stored_data, response)
+                self.revalidated += 1
+            updated[entry.company_name] = response
+
+        for listener in self._listeners:
+            try:
+                listener(updated)
+            except Exception:
+                logger.exception("Validation result listener failed")
+
+    def subscribe(self, listener: ResultListener):
+        """
+        Register a function to call with re-validated results, see ResultListener.
+        """
+        self._listeners.append(listener)
+
+    def results(self) -> dict[str, DataDiscrepancyCheckerResponse]:
+        """
+        Return the latest validation result per company, keyed by company name.
+        """
+        with self._lock:
+            return {entry.company_name: entry.response for entry in self._entries.values()}
+
+    def clear(self):
+        """
+        Drop all kept results and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.reused = self.revalidated = 0
+
+
+validation_results = ValidationResultStore(max_entries=get_settings().validation_results_max_entries)
+add_stored_data_listener(validation_results.stored_data_changed)
@@ -0,0 +1,282 @@
+import json
+import sqlite3
+import threading
+from src.config import get_settings
+from src.storage import SqliteConnectionPool
+
+STORED_DATA_NAMESPACE = "stored_data"
+EXTRACTION_NAMESPACE = "extraction"
+# generations of changed keys kept for workers that haven't looked at a namespace since, see changes_since
+CHANGES_KEPT_GENERATIONS = 64
+
+
+def _configure_connection(conn: sqlite3.Connection):
+    # cache writes may be lost on power failure, which only costs a cache miss
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA busy_timeout = 5000")
+
+
+class SharedCache:
+    """
+    Key-value cache shared by every worker process on a machine, stored in a sqlite database in WAL mode so readers
+    never block each other or the writer.
+
+    Entries belong to a namespace (e.g. stored data or extractions) with a generation counter. invalidate bumps the
+    generation, which hides every existing entry in the namespace from all workers at once. set only stores an
+    entry if the generation hasn't changed since the caller read it (see generation), so a worker can't put data
+    loaded before an invalidation back into the cache. Each namespace keeps its max_entries most recent writes.
+
+    A namespace can also record the version of the data it caches (see sync_source), so it is only invalidated when
+    the data really changes, and can be loaded in full (see load), so a miss means the key doesn't exist. Each load
+    records which keys changed since the previous one, so every worker can find out (see changes_since).
+    """
+
+    _select = ("SELECT value FROM entries JOIN generations USING (namespace) "
+               "WHERE namespace = ? AND key = ? AND entries.generation = generations.generation")
+    _select_generation = "SELECT generation FROM generations WHERE namespace = ?"
+    _insert = ("INSERT OR REPLACE INTO entries (namespace, key, generation, value) "
+               "SELECT namespace, ?, generation, ? FROM generations WHERE namespace = ? AND generation = ?")
+    _select_many = ("SELECT key, value FROM entries JOIN generations USING (namespace) "
+                    "WHERE namespace = ? AND key IN (SELECT value FROM json_each(?)) "
+                    "AND entries.generation = generations.generation")
+    # rowids are shared by all namespaces, so rank by rowid within the namespace rather than subtracting from them
+    _evict = ("DELETE FROM entries WHERE namespace = ? AND rowid < "
+              "(SELECT rowid FROM entries WHERE namespace = ? ORDER BY rowid DESC LIMIT 1 OFFSET ?)")
+    _mark_loaded = ("INSERT INTO sources (namespace, loaded_generation) "
+                    "SELECT namespace, generation FROM generations WHERE namespace = ? AND generation = ? "
+                    "ON CONFLICT (namespace) DO UPDATE SET loaded_generation = excluded.loaded_generation")
+    _bump_generation = ("INSERT INTO generations (namespace, generation) VALUES (?, 1) "
+                        "ON CONFLICT (namespace) DO UPDATE SET generation = generation + 1")
+
+    def __init__(self, path: str, max_entries: int, pool_size: int = 4):
+        self.path = path
+        self.max_entries = max_entries
+        self.pool = SqliteConnectionPool(path, max_size=pool_size, on_connect=_configure_connection)
+        # source versions this process has already synced, so unchanged data costs no query
+        self._synced_versions: dict[str, str] = {}
+        self._create_schema()
+
+    def get(self, namespace: str, key: str) -> bytes | None:
+        """
+        Fetch a cached value. Return None on a miss.
+
+        :param namespace: cache namespace
+        :param key: cache key
+        :return: cached value if found, otherwise None
+        """
+        with self.pool.connection() as conn:
+            row = conn.execute(self._select, (namespace, key)).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, namespace: str, keys: list[str]) -> dict[str, bytes]:
+        """
+        Fetch several cached values in one query. Keys not in the cache are left out.
+
+        :param namespace: cache namespace
+        :param keys: cache keys
+        :return: dict mapping each cached key to its value
+        """
+        with self.pool.connection() as conn:
+            return dict(conn.execute(self._select_many, (namespace, json.dumps(keys))).fetchall())
+
+    def generation(self, namespace: str) -> int:
+        """
+        Return the current generation of a namespace. Read it before loading a value to pass to set.
+
+        :param namespace: cache namespace
+        :return: generation
+        """
+        with self.pool.connection() as conn:
+            row = conn.execute(self._select_generation, (namespace,)).fetchone()
+            if row is None:
+                with conn:
+                    conn.execute("INSERT OR IGNORE INTO generations (namespace, generation) VALUES (?, 0)",
+                                 (namespace,))
+                row = conn.execute(self._select_generation, (namespace,)).fetchone()
+        return row[0]
+
+    def set(self, namespace: str, key: str, value: bytes | str, generation: int) -> bool:
+        """
+        Store a value, unless the namespace was invalidated since generation was read.
+
+        :param namespace: cache namespace
+        :param key: cache key
+        :param value: value to cache
+        :param generation: generation read before the value was loaded
+        :return: True if the value was stored
+        """
+        if isinstance(value, str):
+            value = value.encode()
+        with self.pool.connection() as conn, conn:
+            stored = conn.execute(self._insert, (key, value, namespace, generation)).rowcount > 0
+            if stored:
+                conn.execute(self._evict, (namespace, namespace, self.max_entries - 1))
+        return stored
+
+    def load(self, namespace: str, items: dict[str, bytes | str], generation: int) -> bool:
+        """
+        Store every entry of a namespace and mark it as fully loaded, so is_loaded is True until it is next
+        invalidated. Nothing is stored if the namespace was invalidated since generation was read, or if there
+        are more than max_entries items. If the namespace was loaded before, the keys whose values differ from
+        that load are recorded for changes_since.
+
+        :param namespace: cache namespace
+        :param items: every key in the namespace and its value
+        :param generation: generation read before the values were loaded
+        :return: True if the values were stored
+        """
+        if len(items) > self.max_entries:
+            return False
+        params = [(key, value.encode() if isinstance(value, str) else value, namespace, generation)
+                  for key, value in items.items()]
+        with self.pool.connection() as conn, conn:
+            # take the write lock before reading the previous load, so no other worker can replace it meanwhile
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT generation, loaded_generation FROM generations LEFT JOIN sources "
+                               "USING (namespace) WHERE namespace = ?", (namespace,)).fetchone()
+            if row is None or row[0] != generation:
+                return False
+            if row[1] == generation:
+                # another worker loaded it first
+                return True
+            previous = dict(conn.execute("SELECT key, value FROM entries WHERE namespace = ? AND generation < ?",
+                                         (namespace, generation)).fetchall())
+            if row[1] is not None:
+                changes = [(namespace, generation, key, value) for key, value, _, _ in params
+                           if previous.get(key) != value]
+                changes.extend((namespace, generation, key, None) for key in previous.keys() - items.keys())
+                conn.executemany("INSERT INTO changes (namespace, generation, key, value) VALUES (?, ?, ?, ?)",
+                                 changes)
+                conn.execute("DELETE FROM changes WHERE namespace = ? AND generation < ?",
+                             (namespace, generation - CHANGES_KEPT_GENERATIONS))
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND generation < ?", (namespace, generation))
+            conn.execute(self._mark_loaded, (namespace, generation))
+            conn.executemany(self._insert, params)
+        return True
+
+    def is_loaded(self, namespace: str) -> bool:
+        """
+        Return True if every entry of the namespace was stored by load since it was last invalidated.
+
+        :param namespace: cache namespace
+        :return: True if fully loaded
+        """
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT 1 FROM sources JOIN generations USING (namespace) "
+                               "WHERE namespace = ? AND loaded_generation = generation", (namespace,)).fetchone()
+        return row is not None
+
+    def changes_since(self, namespace: str,
+                      generation: int | None) -> tuple[int | None, dict[str, bytes | None] | None]:
+        """
+        Return the keys of a namespace whose values changed in loads after the given generation, see load.
+
+        :param namespace: cache namespace
+        :param generation: generation of the last load the caller knows about, None if it knows of none
+        :return: generation of the latest load (None if never loaded), and the latest value of each changed key
+                 (None for removed keys), or None if generation is None or older than the changes kept
+        """
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT loaded_generation FROM sources WHERE namespace = ?", (namespace,)).fetchone()
+            loaded_generation = row[0] if row else None
+            if generation is None or loaded_generation is None:
+                return loaded_generation, None
+            if generation < loaded_generation - CHANGES_KEPT_GENERATIONS:
+                return loaded_generation, None
+            rows = conn.execute("SELECT key, value FROM changes WHERE namespace = ? AND generation > ? "
+                                "AND generation <= ? ORDER BY generation",
+                                (namespace, generation, loaded_generation)).fetchall()
+        return loaded_generation, dict(rows)
+
+    def sync_source(self, namespace: str, version: str) -> bool:
+        """
+        Invalidate a namespace if the data it caches has a different version from the one last synced by any
+        worker, e.g. a file modification time. Workers starting up or seeing an unchanged version leave it as is.
+        The invalidated entries are only removed by the next load, which compares them with the new ones.
+
+        :param namespace: cache namespace
+        :param version: current version of the cached data
+        :return: True if the namespace was invalidated
+        """
+        if self._synced_versions.get(namespace) == version:
+            return False
+        with self.pool.connection() as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT version FROM sources WHERE namespace = ?", (namespace,)).fetchone()
+            changed = row is None or row[0] != version
+            if changed:
+                conn.execute("INSERT INTO sources (namespace, version) VALUES (?, ?) ON CONFLICT (namespace) "
+                             "DO UPDATE SET version = excluded.version", (namespace, version))
+                conn.execute(self._bump_generation, (namespace,))
+        self._synced_versions[namespace] = version
+        return changed
+
+    def invalidate(self, namespace: str) -> int:
+        """
+        Hide all entries in a namespace from every worker and remove them.
+
+        :param namespace: cache namespace
+        :return: the new generation
+        """
+        with self.pool.connection() as conn, conn:
+            return self._invalidate(conn, namespace)
+
+    def close(self):
+        """
+        Close all pooled connections.
+        """
+        self.pool.close()
+
+    def _invalidate(self, conn: sqlite3.Connection, namespace: str) -> int:
+        conn.execute(self._bump_generation, (namespace,))
+        generation = conn.execute(self._select_generation, (namespace,)).fetchone()[0]
+        conn.execute("DELETE FROM entries WHERE namespace = ? AND generation < ?", (namespace, generation))
+        return generation
+
+    def _create_schema(self):
+        with self.pool.connection() as conn:
+            # WAL mode is stored in the database file, so every worker's connections use it
+            conn.execute("PRAGMA journal_mode = WAL")
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS generations "
+                             "(namespace TEXT PRIMARY KEY, generation INTEGER NOT NULL)")
+                conn.execute("CREATE TABLE IF NOT EXISTS entries (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+                             "generation INTEGER NOT NULL, value BLOB NOT NULL, PRIMARY KEY (namespace, key))")
+                # ordered by (namespace, rowid), for per namespace eviction
+                conn.execute("CREATE INDEX IF NOT EXISTS entries_namespace ON entries (namespace)")
+                conn.execute("CREATE TABLE IF NOT EXISTS sources "
+                             "(namespace TEXT PRIMARY KEY, version TEXT, loaded_generation INTEGER)")
+                conn.execute("CREATE TABLE IF NOT EXISTS changes (namespace TEXT NOT NULL, "
+                             "generation INTEGER NOT NULL, key TEXT NOT NULL, value BLOB, "
+                             "PRIMARY KEY (namespace, generation, key))")
+
+
+_shared_cache: SharedCache | None = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> SharedCache | None:
+    """
+    Return the shared cache for settings.shared_cache_path, opening it on first use.
+    Opened lazily so each worker process gets its own connections after forking.
+
+    :return: shared cache, or None if not configured
+    """
+    global _shared_cache
+    settings = get_settings()
+    if _shared_cache is None and settings.shared_cache_path:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = SharedCache(settings.shared_cache_path, max_entries=settings.shared_cache_max_entries)
+    return _shared_cache
+
+
+def close_shared_cache():
+    """
+    Close the shared cache, if one was opened. It is reopened on next use.
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is not None:
+            _shared_cache.close()
+            _shared_cache = None
@@ -0,0 +1,52 @@
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, Hashable
+from src.metrics import coalesced_calls
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the call and every caller arriving while
+    it is in flight awaits the same result (or exception). Once it finishes, the next call with that key starts
+    afresh, so results are never reused after the fact, see the caches for that.
+
+    Callers that are cancelled (e.g. a client disconnecting) stop waiting without cancelling the shared call,
+    since other callers may still need it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # asyncio futures are bound to a single event loop, so keep in flight calls per running loop
+        self._in_flight: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    async def run(self, key: Hashable, func: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """
+        Await func(*args, **kwargs), or the call already in flight for key.
+
+        :param key: identifies calls that are interchangeable
+        :param func: async function to call
+        :return: result of the call
+        """
+        loop = asyncio.get_running_loop()
+        in_flight = self._in_flight.setdefault(loop, {})
+        task = in_flight.get(key)
+        if task is None:
+            task = in_flight[key] = loop.create_task(func(*args, **kwargs))
+            task.add_done_callback(lambda done: self._finished(in_flight, key, done))
+        else:
+            coalesced_calls.inc(self.name)
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _finished(in_flight: dict, key: Hashable, task: asyncio.Task):
+        if in_flight.get(key) is task:
+            del in_flight[key]
+        # mark the exception as retrieved, in case every caller was cancelled before it was raised
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        """
+        Return number of calls in flight on the running event loop.
+        """
+        return len(self._in_flight.get(asyncio.get_running_loop(), ()))
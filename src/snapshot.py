@@ -0,0 +1,478 @@
+"""
+Columnar binary snapshot of the company store.
+
+Compiles a csv file in the same format as data/database.csv into a snapshot file that workers memory-map, so
+they start without parsing any csv and share the same pages. Rows are validated once, by the compiler.
+
+Layout: an 8 byte magic, the json metadata length, json metadata describing the columns, then 8 byte aligned
+sections. Decimal columns are stored as scaled int64 values plus an int8 exponent per value, so values round
+trip exactly (e.g. 25 and 25.00 stay distinct); strings are dictionary-encoded as uint32 codes into a per column
+dictionary. The name index is an open addressing hash table of normalised company names (crc32, linear probing)
+mapping each name to its first row.
+
+Usage:
+    python -m src.snapshot data/database.csv data/database.snap
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import mmap
+import operator
+import os
+import struct
+import sys
+import threading
+import typing
+import zlib
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from decimal import Decimal
+from src.models import CompanyData, CompanyRecord
+from src.storage import COMPANY_FIELDS, CompanyStorageBackend, normalize_company_name, file_version
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SUFFIX = ".snap"
+MAGIC = b"COSNAP01"
+HEADER = struct.Struct("<8sQ")
+NULL_EXPONENT = -128
+NULL_INT = -2 ** 63
+NULL_CODE = 2 ** 32 - 1
+
+
+def _column_kind(field: str) -> str:
+    annotation = CompanyData.model_fields[field].annotation
+    types = set(typing.get_args(annotation) or (annotation,)) - {type(None)}
+    if types == {Decimal}:
+        return "decimal"
+    if types == {int}:
+        return "int"
+    if types == {str}:
+        return "string"
+    raise TypeError(f"Unsupported snapshot column type for {field}: {annotation}")
+
+
+COLUMN_KINDS = {field: _column_kind(field) for field in COMPANY_FIELDS}
+
+
+class _SectionWriter:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def add(self, data: bytes) -> list[int]:
+        # keep every section 8 byte aligned so it can be cast to a typed memoryview
+        self.buffer.extend(b"\0" * (-len(self.buffer) % 8))
+        section = [len(self.buffer), len(data)]
+        self.buffer.extend(data)
+        return section
+
+    def add_strings(self, strings: list[str]) -> dict:
+        encoded = [string.encode() for string in strings]
+        offsets = array("I", [0])
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        return {"offsets": self.add(offsets.tobytes()), "data": self.add(b"".join(encoded))}
+
+
+def _scale_decimal(value: Decimal | None) -> tuple[int, int]:
+    if value is None:
+        return 0, NULL_EXPONENT
+    text = str(value)
+    if "E" in text or not value.is_finite():
+        exponent = value.as_tuple().exponent
+        if not isinstance(exponent, int) or not NULL_EXPONENT < exponent < 128:
+            raise ValueError(f"Decimal {value} can't be stored in a snapshot.")
+        scaled = int(value.scaleb(-exponent))
+    else:
+        # plain notation, e.g. -6.67 is -667 with exponent -2; much cheaper than as_tuple
+        integer, _, fraction = text.partition(".")
+        scaled, exponent = int(integer + fraction), -len(fraction)
+        if exponent <= NULL_EXPONENT:
+            raise ValueError(f"Decimal {value} can't be stored in a snapshot.")
+    if not NULL_INT < scaled < 2 ** 63:
+        raise ValueError(f"Decimal {value} can't be stored in a snapshot.")
+    return scaled, exponent
+
+
+def _build_slots(name_keys: list[str]) -> array:
+    # power of two table at most half full, slot values are index entry + 1 so 0 marks an empty slot
+    slots = array("I", [0]) * (1 << max(len(name_keys) * 2, 1).bit_length())
+    mask = len(slots) - 1
+    for entry, name_key in enumerate(name_keys):
+        slot = zlib.crc32(name_key.encode()) & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = entry + 1
+    return slots
+
+
+def compile_snapshot(csv_location: str, snapshot_location: str) -> int:
+    """
+    Compile a csv file in the same format as data/database.csv into a snapshot.
+    The snapshot is written to a temporary file and renamed into place, so open snapshots are never modified.
+
+    :param csv_location: path to csv file
+    :param snapshot_location: path to write the snapshot to
+    :return: number of rows written
+    """
+    with open(csv_location, newline='') as csvfile:
+        records = [CompanyData(**row) for row in csv.DictReader(csvfile)]
+    fields_set = sorted(set().union(*(record.model_fields_set for record in records)))
+
+    sections = _SectionWriter()
+    columns = {}
+    for field, kind in COLUMN_KINDS.items():
+        values = [getattr(record, field) for record in records]
+        if kind == "decimal":
+            scaled, exponents = array("q"), array("b")
+            for value in values:
+                value_scaled, value_exponent = _scale_decimal(value)
+                scaled.append(value_scaled)
+                exponents.append(value_exponent)
+            columns[field] = {"kind": kind, "values": sections.add(scaled.tobytes()),
+                              "exponents": sections.add(exponents.tobytes())}
+        elif kind == "int":
+            ints = [NULL_INT if value is None else value for value in values]
+            columns[field] = {"kind": kind, "values": sections.add(array("q", ints).tobytes())}
+        else:
+            dictionary: dict[str, int] = {}
+            codes = array("I", [NULL_CODE if value is None else dictionary.setdefault(value, len(dictionary))
+                                for value in values])
+            columns[field] = {"kind": kind, "codes": sections.add(codes.tobytes()),
+                              "dictionary": sections.add_strings(list(dictionary))}
+
+    first_rows: dict[str, int] = {}
+    for row, record in enumerate(records):
+        first_rows.setdefault(normalize_company_name(record.company_name), row)
+    index = sections.add_strings(list(first_rows))
+    index["rows"] = sections.add(array("I", first_rows.values()).tobytes())
+    index["slots"] = sections.add(_build_slots(list(first_rows)).tobytes())
+
+    metadata = json.dumps({"byteorder": sys.byteorder, "rows": len(records), "fields_set": fields_set,
+                           "columns": columns, "index": index}).encode()
+    header = HEADER.pack(MAGIC, len(metadata)) + metadata
+    header += b"\0" * (-len(header) % 8)
+
+    tmp_location = f"{snapshot_location}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_location, "wb") as f:
+        f.write(header)
+        f.write(sections.buffer)
+    os.replace(tmp_location, snapshot_location)
+    return len(records)
+
+
+class CompanySnapshot:
+    """
+    Read-only, memory-mapped view of a snapshot. Columns are read in place through typed memoryviews, so opening
+    a snapshot only parses its metadata, and records are decoded one at a time on lookup.
+    """
+
+    def __init__(self, snapshot_location: str):
+        with open(snapshot_location, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, metadata_length = HEADER.unpack_from(self._mmap)
+            if magic != MAGIC:
+                raise ValueError(f"{snapshot_location} is not a company snapshot.")
+            metadata = json.loads(self._mmap[HEADER.size:HEADER.size + metadata_length])
+            if metadata["byteorder"] != sys.byteorder:
+                raise ValueError(f"{snapshot_location} was compiled on a {metadata['byteorder']} endian machine.")
+        except Exception:
+            self._mmap.close()
+            raise
+
+        data_start = HEADER.size + metadata_length
+        self._data = memoryview(self._mmap)[data_start + (-data_start % 8):]
+        self._rows = metadata["rows"]
+        self._fields_set = frozenset(metadata["fields_set"])
+        self._columns = metadata["columns"]
+        self._index = metadata["index"]
+        self._decoders = [self._column_decoder(metadata["columns"][field]) for field in COMPANY_FIELDS]
+        self._index_offsets, self._index_data = self._strings(metadata["index"])
+        self._index_rows = self._section(metadata["index"]["rows"], "I")
+        self._index_slots = self._section(metadata["index"]["slots"], "I")
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def find(self, company_name: str) -> int | None:
+        """
+        Return the first row matching company name, or None if not found.
+
+        :param company_name: name of company
+        :return: row number
+        """
+        name_key = normalize_company_name(company_name).encode()
+        offsets, data, slots = self._index_offsets, self._index_data, self._index_slots
+        mask = len(slots) - 1
+        slot = zlib.crc32(name_key) & mask
+        while entry := slots[slot]:
+            entry -= 1
+            if data[offsets[entry]:offsets[entry + 1]] == name_key:
+                return self._index_rows[entry]
+            slot = (slot + 1) & mask
+        return None
+
+    def record(self, row: int) -> CompanyRecord:
+        """
+        Decode one row. Rows were validated when the snapshot was compiled, so the record can be trusted.
+
+        :param row: row number
+        :return: CompanyRecord
+        """
+        return CompanyRecord(tuple([decode(row) for decode in self._decoders]), self._fields_set)
+
+    def records(self) -> dict[str, CompanyRecord]:
+        """
+        Decode the first row for every company name, keyed by normalised company name.
+        """
+        return {name_key: self.record(row) for name_key, row in self.name_rows().items()}
+
+    def name_key(self, entry: int) -> str:
+        """
+        Return the normalised company name of an entry in the name index, see first_rows.
+        """
+        return bytes(self._index_data[self._index_offsets[entry]:self._index_offsets[entry + 1]]).decode()
+
+    def first_rows(self) -> list[int]:
+        """
+        Return the first row of each company name, in name index order.
+        """
+        return self._index_rows.tolist()
+
+    def section_bytes(self, field: str | None = None) -> bytes:
+        """
+        Return the stored bytes of a column, or of the name index if field is None. Equal bytes mean equal data,
+        so snapshots can be compared without decoding.
+
+        :param field: CompanyData field name
+        :return: bytes of every section of the column
+        """
+        return b"".join(bytes(self._data[start:start + length])
+                        for start, length in _section_spans(self._index if field is None else self._columns[field]))
+
+    def name_rows(self) -> dict[str, int]:
+        """
+        Return the first row for every company name, keyed by normalised company name.
+        """
+        offsets, data = self._index_offsets.tolist(), bytes(self._index_data)
+        return {data[start:end].decode(): row
+                for start, end, row in zip(offsets, offsets[1:], self._index_rows.tolist())}
+
+    def raw_column(self, field: str) -> list[list]:
+        """
+        Return the stored values of a column by row without decoding them, for comparing snapshots: scaled
+        values and exponents for decimals, values for ints and utf-8 bytes for strings.
+
+        :param field: CompanyData field name
+        :return: one list of values per part of the column
+        """
+        column = self._columns[field]
+        if column["kind"] == "decimal":
+            return [self._section(column["values"], "q").tolist(), self._section(column["exponents"], "b").tolist()]
+        if column["kind"] == "int":
+            return [self._section(column["values"], "q").tolist()]
+
+        offsets, data = self._strings(column["dictionary"])
+        offsets, data = offsets.tolist(), bytes(data)
+        # codes differ between snapshots when strings are added, so compare the strings themselves
+        dictionary = {code: data[start:end] for code, (start, end) in enumerate(zip(offsets, offsets[1:]))}
+        dictionary[NULL_CODE] = None
+        return [list(map(dictionary.__getitem__, self._section(column["codes"], "I").tolist()))]
+
+    def close(self):
+        """
+        Release the memory map.
+        """
+        # views into the map must be released before it can be closed
+        self._decoders = []
+        self._index_offsets = self._index_data = self._index_rows = self._index_slots = self._data = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # a lookup still holds a view, the map is closed once it is garbage collected
+            pass
+
+    def _section(self, section: list[int], typecode: str) -> memoryview:
+        start, length = section
+        return self._data[start:start + length].cast(typecode)
+
+    def _strings(self, column: dict) -> tuple[memoryview, memoryview]:
+        return self._section(column["offsets"], "I"), self._section(column["data"], "B")
+
+    def _column_decoder(self, column: dict):
+        if column["kind"] == "decimal":
+            values, exponents = self._section(column["values"], "q"), self._section(column["exponents"], "b")
+
+            def decode_decimal(row: int) -> Decimal | None:
+                exponent = exponents[row]
+                if not exponent:
+                    return Decimal(values[row])
+                return None if exponent == NULL_EXPONENT else Decimal(values[row]).scaleb(exponent)
+            return decode_decimal
+
+        if column["kind"] == "int":
+            ints = self._section(column["values"], "q")
+
+            def decode_int(row: int) -> int | None:
+                value = ints[row]
+                return None if value == NULL_INT else value
+            return decode_int
+
+        codes = self._section(column["codes"], "I")
+        offsets, data = self._strings(column["dictionary"])
+
+        def decode_string(row: int) -> str | None:
+            code = codes[row]
+            return None if code == NULL_CODE else str(data[offsets[code]:offsets[code + 1]], "utf-8")
+        return decode_string
+
+
+class SnapshotCompanyBackend(CompanyStorageBackend):
+    """
+    Company data read from a memory-mapped snapshot (see compile_snapshot). Opening is instant and the mapped
+    pages are shared between worker processes.
+
+    The snapshot is reopened when its modification time changes. Compiling a new snapshot replaces the file,
+    so a mapping that is still in use keeps reading the old data. Change listeners are notified from a background
+    thread once the old and new snapshots have been diffed (see diff_snapshots), so lookups don't wait for it.
+    """
+
+    def __init__(self, db_location: str):
+        super().__init__()
+        self.db_location = db_location
+        self._snapshot: CompanySnapshot | None = None
+        self._mtime_ns: int | None = None
+        self._lock = threading.Lock()
+        # one thread, so listeners are notified of reloads in order
+        self._diff_executor: ThreadPoolExecutor | None = None
+        self._pending_diff: Future | None = None
+
+    def get(self, company_name: str) -> CompanyData | None:
+        snapshot = self._current_snapshot()
+        row = snapshot.find(company_name)
+        return snapshot.record(row).to_company_data() if row is not None else None
+
+    def get_many(self, company_names: list[str]) -> dict[str, CompanyData | None]:
+        snapshot = self._current_snapshot()
+        found = {}
+        for company_name in company_names:
+            row = snapshot.find(company_name)
+            found[company_name] = snapshot.record(row).to_company_data() if row is not None else None
+        return found
+
+    def refresh(self):
+        self._current_snapshot()
+        # wait for listeners to be told about any reload, including one noticed by an earlier lookup
+        pending_diff = self._pending_diff
+        if pending_diff is not None:
+            pending_diff.result()
+
+    def source_version(self) -> str:
+        return file_version(self.db_location)
+
+    def scan(self) -> typing.Iterator[tuple[str, CompanyRecord]]:
+        return iter(self._current_snapshot().records().items())
+
+    def close(self):
+        with self._lock:
+            if self._diff_executor is not None:
+                self._diff_executor.shutdown()
+                self._diff_executor = None
+            if self._snapshot is not None:
+                self._snapshot.close()
+                self._snapshot = None
+                self._mtime_ns = None
+
+    def _current_snapshot(self) -> CompanySnapshot:
+        mtime_ns = os.stat(self.db_location).st_mtime_ns
+        if mtime_ns != self._mtime_ns:
+            with self._lock:
+                # re-check in case another thread reopened while we were waiting for the lock
+                if mtime_ns != self._mtime_ns:
+                    old_snapshot, self._snapshot = self._snapshot, CompanySnapshot(self.db_location)
+                    if old_snapshot is not None and self._change_listeners:
+                        if self._diff_executor is None:
+                            self._diff_executor = ThreadPoolExecutor(max_workers=1,
+                                                                     thread_name_prefix="snapshot-diff")
+                        self._pending_diff = self._diff_executor.submit(self._notify_diff, old_snapshot,
+                                                                        self._snapshot)
+                    # the old mapping is left for the garbage collector, lookups may still be reading it
+                    self._mtime_ns = mtime_ns
+        return self._snapshot
+
+    def _notify_diff(self, old_snapshot: CompanySnapshot, new_snapshot: CompanySnapshot):
+        try:
+            changed = diff_snapshots(old_snapshot, new_snapshot)
+        except Exception:
+            logger.exception("Diffing snapshot %s failed", self.db_location)
+            return
+        self._notify_changed(changed)
+
+
+def _section_spans(column: dict) -> list[list[int]]:
+    spans = []
+    for key, value in sorted(column.items()):
+        if isinstance(value, dict):
+            spans.extend(_section_spans(value))
+        elif isinstance(value, list):
+            spans.append(value)
+    return spans
+
+
+def diff_snapshots(old: CompanySnapshot, new: CompanySnapshot) -> dict[str, CompanyData | None]:
+    """
+    Compare two snapshots column by column on their stored values, only decoding the records that changed.
+    Columns with identical bytes are skipped, so a recompile that changes a few values costs little more than
+    reading the changed columns.
+
+    :param old: snapshot before the change
+    :param new: snapshot after the change
+    :return: changed CompanyData keyed by normalised company name, None for removed companies
+    """
+    changed_fields = [field for field in COMPANY_FIELDS if old.section_bytes(field) != new.section_bytes(field)]
+    if old.section_bytes() == new.section_bytes():
+        # same companies in the same rows, so changed columns can be compared row by row
+        differing = set()
+        for field in changed_fields:
+            for old_part, new_part in zip(old.raw_column(field), new.raw_column(field)):
+                differing.update(itertools.compress(range(len(new_part)), map(operator.ne, old_part, new_part)))
+        return {new.name_key(entry): new.record(row).to_company_data()
+                for entry, row in enumerate(new.first_rows()) if row in differing}
+
+    old_rows, new_rows = old.name_rows(), new.name_rows()
+    changed = {name_key: None for name_key in old_rows.keys() - new_rows.keys()}
+    added = new_rows.keys() - old_rows.keys()
+
+    # rows of the companies in both snapshots, paired by position
+    name_keys = [name_key for name_key in new_rows if name_key in old_rows]
+    old_selected = [old_rows[name_key] for name_key in name_keys]
+    new_selected = [new_rows[name_key] for name_key in name_keys]
+    differing = set()
+    for field in COMPANY_FIELDS:
+        for old_part, new_part in zip(old.raw_column(field), new.raw_column(field)):
+            old_values = list(map(old_part.__getitem__, old_selected))
+            new_values = list(map(new_part.__getitem__, new_selected))
+            if old_values != new_values:
+                differing.update(itertools.compress(range(len(name_keys)), map(operator.ne, old_values, new_values)))
+
+    changed.update({name_key: new.record(new_rows[name_key]).to_company_data()
+                    for name_key in itertools.chain(added, (name_keys[i] for i in differing))})
+    return changed
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv_location", help="csv file in the same format as data/database.csv")
+    parser.add_argument("snapshot_location", help=f"snapshot file to write, e.g. data/database{SNAPSHOT_SUFFIX}")
+    args = parser.parse_args(argv)
+
+    rows = compile_snapshot(args.csv_location, args.snapshot_location)
+    print(f"Wrote {rows} rows to {args.snapshot_location}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+import csv
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Iterator
+from src.models import CompanyData, CompanyRecord
+
+logger = logging.getLogger(__name__)
+
+SQLITE_URL_PREFIX = "sqlite:///"
+COMPANY_FIELDS = tuple(CompanyData.model_fields)
+
+# called with the stored data that changed, keyed by normalised company name (None for removed companies)
+ChangeListener = Callable[[dict[str, CompanyData | None]], None]
+
+
+def normalize_company_name(company_name: str) -> str:
+    """
+    Normalise a company name for index lookups, ignoring case and surrounding whitespace.
+
+    :param company_name: name of company
+    :return: normalised company name
+    """
+    return company_name.strip().casefold()
+
+
+class CompanyStorageBackend(ABC):
+    """
+    Storage for company data, looked up by company name. Names are matched after normalize_company_name.
+    Change listeners are told which companies' data changed whenever the stored data is replaced.
+    """
+
+    def __init__(self):
+        self._change_listeners: list[ChangeListener] = []
+
+    @abstractmethod
+    def get(self, company_name: str) -> CompanyData | None:
+        """
+        Fetch stored company data matching company name. Return None if no match found.
+
+        :param company_name: name of company
+        :return: CompanyData object if found, otherwise None
+        """
+
+    @abstractmethod
+    def get_many(self, company_names: list[str]) -> dict[str, CompanyData | None]:
+        """
+        Fetch stored company data for several company names in one lookup.
+
+        :param company_names: list of company names
+        :return: dict mapping each given company name to its CompanyData object, or None if not found
+        """
+
+    def refresh(self):
+        """
+        Pick up changes to the underlying data now rather than on the next lookup, notifying change listeners.
+        """
+
+    def source_version(self) -> str | None:
+        """
+        Return a token that changes whenever the underlying data changes, read without loading the data.
+        Return None if the backend can't tell.
+        """
+        return None
+
+    @abstractmethod
+    def scan(self) -> Iterator[tuple[str, CompanyRecord]]:
+        """
+        Read every company's record once, keyed by normalised company name, without keeping an index in memory.
+
+        :return: iterator of (normalised company name, CompanyRecord), first row per name
+        """
+
+    def add_change_listener(self, listener: ChangeListener):
+        """
+        Register a function to call with changed company data, see ChangeListener.
+        """
+        self._change_listeners.append(listener)
+
+    def close(self):
+        """
+        Release any resources held by the backend.
+        """
+
+    def _notify_changed(self, changed: dict[str, CompanyData | None]):
+        if not changed:
+            return
+        for listener in self._change_listeners:
+            try:
+                listener(changed)
+            except Exception:
+                logger.exception("Stored data change listener failed")
+
+
+class CsvCompanyBackend(CompanyStorageBackend):
+    """
+    In-memory index of company data from a csv file, keyed by normalised company name.
+    Rows are validated once at load time and held as CompanyRecords, so lookups skip validation.
+
+    The csv file is parsed once and only reloaded when its modification time changes. A reload builds a complete
+    new index before swapping it in, so concurrent lookups see either the old or the new data and never a partial one.
+    """
+
+    def __init__(self, db_location: str):
+        super().__init__()
+        self.db_location = db_location
+        self._index: dict[str, CompanyRecord] = {}
+        self._mtime_ns: int | None = None
+        self._lock = threading.Lock()
+
+    def get(self, company_name: str) -> CompanyData | None:
+        record = self._current_index().get(normalize_company_name(company_name))
+        return record.to_company_data() if record else None
+
+    def get_many(self, company_names: list[str]) -> dict[str, CompanyData | None]:
+        # look everything up against a single snapshot of the index
+        index = self._current_index()
+        found = {}
+        for company_name in company_names:
+            record = index.get(normalize_company_name(company_name))
+            found[company_name] = record.to_company_data() if record else None
+        return found
+
+    def refresh(self):
+        self._current_index()
+
+    def source_version(self) -> str:
+        return file_version(self.db_location)
+
+    def scan(self) -> Iterator[tuple[str, CompanyRecord]]:
+        return self._read_records()
+
+    def _current_index(self) -> dict[str, CompanyRecord]:
+        mtime_ns = os.stat(self.db_location).st_mtime_ns
+        if mtime_ns != self._mtime_ns:
+            changed = {}
+            with self._lock:
+                # re-check in case another thread reloaded while we were waiting for the lock
+                if mtime_ns != self._mtime_ns:
+                    old_index, self._index = self._index, self._build_index()
+                    if self._mtime_ns is not None:
+                        changed = diff_company_records(old_index, self._index)
+                    self._mtime_ns = mtime_ns
+            self._notify_changed(changed)
+        return self._index
+
+    def _build_index(self) -> dict[str, CompanyRecord]:
+        return dict(self._read_records())
+
+    def _read_records(self) -> Iterator[tuple[str, CompanyRecord]]:
+        seen = set()
+        with open(self.db_location, newline='') as csvfile:
+            reader = csv.DictReader(csvfile)
+            for row in reader:
+                name_key = normalize_company_name(row['Company Name'])
+                # keep the first matching row, same as the previous linear scan
+                if name_key not in seen:
+                    seen.add(name_key)
+                    yield name_key, CompanyRecord.from_company_data(CompanyData(**row))
+
+
+class SqliteConnectionPool:
+    """
+    Fixed size pool of sqlite connections shared between threads. Connections are opened on demand, and passed to
+    on_connect (e.g. to set pragmas) when opened.
+    """
+
+    def __init__(self, path: str, max_size: int, on_connect: Callable[[sqlite3.Connection], None] | None = None):
+        self.path = path
+        self.max_size = max_size
+        self.on_connect = on_connect
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """
+        Number of open connections, idle or in use.
+        """
+        return self._size
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of the with block.
+
+        :return: context manager yielding a sqlite3.Connection
+        """
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._size -= 1
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._size < self.max_size
+            if create:
+                self._size += 1
+        if create:
+            try:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                if self.on_connect is not None:
+                    self.on_connect(conn)
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                raise
+            return conn
+        return self._idle.get()
+
+
+class SqlCompanyBackend(CompanyStorageBackend):
+    """
+    Company data stored in a sqlite database, in a companies table indexed on normalised company name.
+
+    Lookups use fixed sql statements, so sqlite prepares each one once per pooled connection and reuses it.
+    get_many passes all names as a single json array parameter, so a batch of any size is one query.
+    """
+
+    _columns = ", ".join(COMPANY_FIELDS)
+    _select_one = f"SELECT {_columns} FROM companies WHERE name_key = ? ORDER BY rowid LIMIT 1"
+    _select_all = f"SELECT name_key, {_columns} FROM companies ORDER BY rowid"
+    _select_many = (f"SELECT name_key, {_columns} FROM companies "
+                    f"WHERE name_key IN (SELECT value FROM json_each(?)) ORDER BY rowid")
+    _insert = (f"INSERT INTO companies (name_key, {_columns}) "
+               f"VALUES (?, {', '.join('?' for _ in COMPANY_FIELDS)})")
+
+    def __init__(self, db_location: str, pool_size: int):
+        super().__init__()
+        self.db_location = db_location.removeprefix(SQLITE_URL_PREFIX)
+        self.pool = SqliteConnectionPool(self.db_location, max_size=pool_size)
+        self._create_schema()
+
+    def get(self, company_name: str) -> CompanyData | None:
+        with self.pool.connection() as conn:
+            row = conn.execute(self._select_one, (normalize_company_name(company_name),)).fetchone()
+        return self._parse_row(row) if row else None
+
+    def get_many(self, company_names: list[str]) -> dict[str, CompanyData | None]:
+        name_keys = {company_name: normalize_company_name(company_name) for company_name in company_names}
+        with self.pool.connection() as conn:
+            rows = conn.execute(self._select_many, (json.dumps(list(set(name_keys.values()))),)).fetchall()
+
+        found = {}
+        for name_key, *row in rows:
+            if name_key not in found:
+                found[name_key] = self._parse_row(row)
+        return {company_name: found.get(name_key) for company_name, name_key in name_keys.items()}
+
+    def source_version(self) -> str:
+        return file_version(self.db_location)
+
+    def scan(self) -> Iterator[tuple[str, CompanyRecord]]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(self._select_all).fetchall()
+        for name_key, values in self._first_rows(rows).items():
+            yield name_key, CompanyRecord.from_company_data(self._parse_row(values))
+
+    def import_csv(self, csv_location: str):
+        """
+        Replace all stored company data with the contents of a csv file in the same format as data/database.csv.
+        Change listeners are notified of companies whose data differs from what was stored before.
+
+        :param csv_location: path to csv file
+        """
+        rows = []
+        with open(csv_location, newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                company_data = CompanyData(**row)
+                rows.append((normalize_company_name(company_data.company_name),
+                             *(self._to_column(getattr(company_data, field)) for field in COMPANY_FIELDS)))
+
+        with self.pool.connection() as conn, conn:
+            old_rows = conn.execute(self._select_all).fetchall()
+            conn.execute("DELETE FROM companies")
+            conn.executemany(self._insert, rows)
+
+        old_values, new_values = self._first_rows(old_rows), self._first_rows(rows)
+        changed = {name_key: self._parse_row(values) for name_key, values in new_values.items()
+                   if old_values.get(name_key) != values}
+        changed.update({name_key: None for name_key in old_values.keys() - new_values.keys()})
+        self._notify_changed(changed)
+
+    def close(self):
+        self.pool.close()
+
+    def _create_schema(self):
+        # numeric values are stored as text so decimals round trip exactly
+        columns = ", ".join(f"{field} TEXT" for field in COMPANY_FIELDS)
+        with self.pool.connection() as conn, conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS companies (name_key TEXT NOT NULL, {columns})")
+            conn.execute("CREATE INDEX IF NOT EXISTS companies_name_key ON companies (name_key)")
+
+    @staticmethod
+    def _first_rows(rows) -> dict[str, tuple]:
+        first_rows = {}
+        for name_key, *values in rows:
+            first_rows.setdefault(name_key, tuple(values))
+        return first_rows
+
+    @staticmethod
+    def _to_column(value):
+        return None if value is None else str(value)
+
+    @staticmethod
+    def _parse_row(row) -> CompanyData:
+        return CompanyData(**{field: value for field, value in zip(COMPANY_FIELDS, row) if value is not None})
+
+
+def file_version(path: str) -> str:
+    """
+    Return a token that changes whenever a file is modified, see CompanyStorageBackend.source_version.
+
+    :param path: file path
+    :return: modification time and size of the file
+    """
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def diff_company_records(old_index: dict[str, CompanyRecord],
+                         new_index: dict[str, CompanyRecord]) -> dict[str, CompanyData | None]:
+    """
+    Compare two sets of records keyed by normalised company name.
+
+    :param old_index: records before the change
+    :param new_index: records after the change
+    :return: changed CompanyData keyed by normalised company name, None for removed companies
+    """
+    changed = {name_key: record.to_company_data() for name_key, record in new_index.items()
+               if name_key not in old_index or old_index[name_key].values != record.values}
+    changed.update({name_key: None for name_key in old_index.keys() - new_index.keys()})
+    return changed
+
+
+def create_backend(db_location: str, pool_size: int) -> CompanyStorageBackend:
+    """
+    Create the storage backend for a db location: sqlite:///<path> for a sqlite database, a .snap file for a
+    snapshot compiled by src.snapshot, otherwise a csv file path.
+
+    :param db_location: csv file path, snapshot file path or sqlite url
+    :param pool_size: max connections for sql backends
+    :return: storage backend
+    """
+    if db_location.startswith(SQLITE_URL_PREFIX):
+        return SqlCompanyBackend(db_location, pool_size=pool_size)
+    if db_location.endswith(".snap"):
+        # imported here as the snapshot module builds on this one
+        from src.snapshot import SnapshotCompanyBackend
+        return SnapshotCompanyBackend(db_location)
+    return CsvCompanyBackend(db_location)
@@ -1,13 +1,40 @@
+import asyncio
+import contextlib
+import hashlib
 import io
+import json
+import time
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
 from unittest.mock import patch
 from decimal import Decimal
-from src.data_discrepancy_checker import get_mismatched_fields, validate_company_data
-from src.data_layer import load_company_data
-from src.models import CompanyData, DataDiscrepancyCheckerResponse, MismatchedFields
+from src.data_discrepancy_checker import (get_comparators, get_mismatched_fields, validate_company_data,
+                                          get_bulk_mismatches)
+from src.data_layer import _LocalRecords, load_company_data, load_many_company_data, refresh_stored_data
+from src.storage import (CsvCompanyBackend, SqlCompanyBackend, create_backend, diff_company_records,
+                         normalize_company_name)
+from src.config import settings
+from src.models import CompanyData, CompanyRecord, DataDiscrepancyCheckerResponse, MismatchedFields
+from fastapi.concurrency import run_in_threadpool
 from fastapi.testclient import TestClient
-from main import app
-from src.pdf_service_api import extract_and_parse_pdf_data
+from main import app, extraction_client, validation_results, _extract_and_validate
+from src.pdf_service_api import extract_and_parse_pdf_data, extraction_cache, AsyncExtractionClient, PdfServicePool
+from src.extraction_cache import ExtractionCache, hash_pdf_file
+from src.comparison_rules import FieldRule, compile_comparators
+from src.metrics import Counter, Histogram, stage_timer, track_request
+from src.benchmarks import compare_to_baseline, generate_company_rows, import_times, write_synthetic_csv
+from src.pre_extraction import PreExtractionWorker
+from src.revalidation import ValidationResultStore
+from src.uploads import receive_pdf_upload
+from src.snapshot import CompanySnapshot, SnapshotCompanyBackend, compile_snapshot, diff_snapshots
+from src.shared_cache import EXTRACTION_NAMESPACE, STORED_DATA_NAMESPACE, SharedCache
+from src.single_flight import SingleFlight
+from src.reconcile import main as reconcile_main
 
 test_company_data = {
     'Company Name': 'HealthInc',
@@ -64,6 +91,253 @@ class TestDataLayer(unittest.TestCase):
 
         self.assertIsNone(result)
 
+    def test_load_many_company_data(self):
+        """
+        Expect load_many_company_data to map every requested name to its stored data, or None if not found.
+        """
+        result = load_many_company_data(["TechCorp", "Fake Company", "RetailCo"])
+
+        self.assertEqual(list(result), ["TechCorp", "Fake Company", "RetailCo"])
+        self.assertEqual(result["TechCorp"], load_company_data("TechCorp"))
+        self.assertIsNone(result["Fake Company"])
+        self.assertEqual(result["RetailCo"].location, "Chicago")
+
+
+class TestCompanyRecord(unittest.TestCase):
+
+    def test_to_company_data(self):
+        """
+        Expect CompanyData built from a record to match the validated original, including its json.
+        """
+        company_data = CompanyData(**test_company_data)
+
+        result = CompanyRecord.from_company_data(company_data).to_company_data()
+
+        self.assertEqual(result, company_data)
+        self.assertEqual(result.model_fields_set, company_data.model_fields_set)
+        self.assertEqual(result.model_dump_json(), company_data.model_dump_json())
+
+    def test_to_company_data_returns_independent_objects(self):
+        """
+        Expect changes to a returned CompanyData not to affect the record.
+        """
+        record = CompanyRecord.from_company_data(CompanyData(**test_company_data))
+
+        record.to_company_data().revenue = Decimal(1)
+
+        self.assertEqual(record.to_company_data().revenue, Decimal(1000))
+
+
+class TestCsvCompanyBackend(unittest.TestCase):
+    header = ('Company Name,Industry,Market Capitalization,Revenue (in millions),EBITDA (in millions),'
+              'Net Income (in millions),Debt (in millions),Equity (in millions),Enterprise Value (in millions),'
+              'P/E Ratio,Revenue Growth Rate (%),EBITDA Margin (%),Net Income Margin (%),'
+              'ROE (Return on Equity) (%),ROA (Return on Assets) (%),Current Ratio,Debt to Equity Ratio,Location\n')
+
+    def setUp(self):
+        fd, self.db_location = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        self.write_rows([self.row('TechCorp', 'San Francisco')])
+        self.store = CsvCompanyBackend(self.db_location)
+
+    def tearDown(self):
+        os.remove(self.db_location)
+
+    @staticmethod
+    def row(company_name, location):
+        return f'{company_name},Technology,5000,1500,300,100,200,800,5400,25,10,20,6.67,12.5,7.5,2.5,0.25,{location}\n'
+
+    def write_rows(self, rows, mtime_ns=None):
+        with open(self.db_location, 'w') as f:
+            f.write(self.header + ''.join(rows))
+        if mtime_ns is not None:
+            os.utime(self.db_location, ns=(mtime_ns, mtime_ns))
+
+    def test_get_normalises_company_name(self):
+        """
+        Expect lookups to ignore case and surrounding whitespace.
+        """
+        result = self.store.get('  techcorp ')
+
+        self.assertEqual(result.company_name, 'TechCorp')
+        self.assertIsNone(self.store.get('Fake Company'))
+
+    def test_get_reloads_when_file_changes(self):
+        """
+        Expect the index to be rebuilt once the file modification time changes.
+        """
+        self.assertEqual(self.store.get('TechCorp').location, 'San Francisco')
+
+        self.write_rows([self.row('TechCorp', 'Austin'), self.row('RetailCo', 'Chicago')], mtime_ns=10 ** 18)
+
+        self.assertEqual(self.store.get('TechCorp').location, 'Austin')
+        self.assertEqual(self.store.get('RetailCo').location, 'Chicago')
+
+    def test_reload_notifies_changed_companies(self):
+        """
+        Expect a reload to notify listeners of changed, added and removed companies only.
+        """
+        self.write_rows([self.row('TechCorp', 'San Francisco'), self.row('RetailCo', 'Chicago')], mtime_ns=10 ** 17)
+        self.store.get('TechCorp')
+        notifications = []
+        self.store.add_change_listener(notifications.append)
+
+        self.write_rows([self.row('TechCorp', 'Austin'), self.row('HealthInc', 'Boston')], mtime_ns=10 ** 18)
+        self.store.refresh()
+
+        self.assertEqual(len(notifications), 1)
+        changed = notifications[0]
+        self.assertEqual(changed.keys(), {'techcorp', 'healthinc', 'retailco'})
+        self.assertEqual(changed['techcorp'].location, 'Austin')
+        self.assertIsNone(changed['retailco'])
+
+    @patch('src.storage.CompanyData')
+    def test_get_parses_file_once(self, mock_company_data):
+        """
+        Expect repeated lookups against an unchanged file not to re-parse any rows.
+        """
+        self.store.get('TechCorp')
+        self.store.get('TechCorp')
+
+        mock_company_data.assert_called_once()
+
+
+class TestSqlCompanyBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.backend = create_backend(f'sqlite:///{self.db_dir}/companies.db', pool_size=2)
+        self.backend.import_csv(settings.db_location)
+
+    def tearDown(self):
+        self.backend.close()
+        shutil.rmtree(self.db_dir)
+
+    def test_create_backend(self):
+        """
+        Expect sqlite urls to use the sql backend and anything else the csv backend.
+        """
+        self.assertIsInstance(self.backend, SqlCompanyBackend)
+        self.assertIsInstance(create_backend(settings.db_location, pool_size=2), CsvCompanyBackend)
+
+    def test_get(self):
+        """
+        Expect the sql backend to return the same data as the csv file it was imported from.
+        """
+        self.assertEqual(self.backend.get(' techcorp'), load_company_data('TechCorp'))
+        self.assertIsNone(self.backend.get('Fake Company'))
+
+    def test_get_many(self):
+        """
+        Expect get_many to map every requested name to its stored data, or None if not found.
+        """
+        result = self.backend.get_many(['HealthInc', 'Fake Company', 'retailco'])
+
+        self.assertEqual(result, {'HealthInc': load_company_data('HealthInc'), 'Fake Company': None,
+                                  'retailco': load_company_data('RetailCo')})
+
+    def test_pool_reuses_connections(self):
+        """
+        Expect lookups to reuse pooled connections rather than opening new ones.
+        """
+        for _ in range(5):
+            self.backend.get('TechCorp')
+
+        self.assertEqual(self.backend.pool.size, 1)
+
+
+class TestSnapshotCompanyBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.snapshot_location = os.path.join(self.db_dir, 'database.snap')
+        compile_snapshot(settings.db_location, self.snapshot_location)
+        self.backend = create_backend(self.snapshot_location, pool_size=2)
+
+    def tearDown(self):
+        self.backend.close()
+        shutil.rmtree(self.db_dir)
+
+    def test_create_backend(self):
+        """
+        Expect .snap files to use the snapshot backend.
+        """
+        self.assertIsInstance(self.backend, SnapshotCompanyBackend)
+
+    def test_get_matches_csv(self):
+        """
+        Expect every record to round trip exactly, including the scale of decimal values.
+        """
+        csv_backend = CsvCompanyBackend(settings.db_location)
+        for company_name in ['TechCorp', 'HealthInc', 'RetailCo', 'FinanceLLC', 'ManuCorp']:
+            result = self.backend.get(company_name)
+            self.assertEqual(result, csv_backend.get(company_name))
+            self.assertEqual(result.model_dump_json(), csv_backend.get(company_name).model_dump_json())
+        self.assertEqual(self.backend.get(' techcorp').company_name, 'TechCorp')
+        self.assertIsNone(self.backend.get('Fake Company'))
+
+    def test_get_many(self):
+        """
+        Expect get_many to map every requested name to its stored data, or None if not found.
+        """
+        result = self.backend.get_many(['HealthInc', 'Fake Company'])
+
+        self.assertEqual(result, {'HealthInc': load_company_data('HealthInc'), 'Fake Company': None})
+
+    def test_reopens_recompiled_snapshot(self):
+        """
+        Expect a recompiled snapshot to be picked up and listeners told which companies changed.
+        """
+        csv_location = os.path.join(self.db_dir, 'database.csv')
+        with open(settings.db_location) as f:
+            rows = f.read().splitlines(keepends=True)
+        with open(csv_location, 'w') as f:
+            f.writelines([rows[0], rows[1].replace('San Francisco', 'Austin')] + rows[2:])
+        self.backend.get('TechCorp')
+        notifications = []
+        self.backend.add_change_listener(notifications.append)
+
+        compile_snapshot(csv_location, self.snapshot_location)
+        os.utime(self.snapshot_location, ns=(10 ** 18, 10 ** 18))
+
+        self.assertEqual(self.backend.get('TechCorp').location, 'Austin')
+        self.backend.refresh()
+        self.assertEqual(notifications, [{'techcorp': self.backend.get('TechCorp')}])
+
+    def test_diff_snapshots(self):
+        """
+        Expect changed, added and removed companies to be found, whether or not rows moved.
+        """
+        csv_location = os.path.join(self.db_dir, 'database.csv')
+        with open(settings.db_location) as f:
+            header, techcorp, *rows = f.read().splitlines(keepends=True)
+        old = CompanySnapshot(self.snapshot_location)
+        cases = {
+            'edited in place': ([header, techcorp.replace('San Francisco', 'Austin')] + rows, {'techcorp'}),
+            'rows moved': ([header] + rows[1:] + [techcorp.replace('TechCorp', 'NewCorp')],
+                           {'newcorp', normalize_company_name(rows[0].split(',')[0]), 'techcorp'}),
+        }
+        for case, (lines, expected) in cases.items():
+            with self.subTest(case=case):
+                with open(csv_location, 'w') as f:
+                    f.writelines(lines)
+                new_location = os.path.join(self.db_dir, f'{case}.snap')
+                compile_snapshot(csv_location, new_location)
+                new = CompanySnapshot(new_location)
+
+                self.assertEqual(diff_snapshots(old, new), diff_company_records(old.records(), new.records()))
+                self.assertEqual(set(diff_snapshots(old, new)), expected)
+                new.close()
+        self.assertEqual(diff_snapshots(old, old), {})
+        old.close()
+
+    def test_rejects_other_files(self):
+        """
+        Expect files that aren't snapshots to be rejected.
+        """
+        with self.assertRaises(ValueError):
+            SnapshotCompanyBackend(settings.db_location).get('TechCorp')
+
 
 class TestDataDiscrepancyChecker(unittest.TestCase):
     def setUp(self):
@@ -96,6 +370,44 @@ class TestDataDiscrepancyChecker(unittest.TestCase):
 
         self.assertEqual(result, self.mismatched_fields)
 
+    def test_get_mismatched_fields_within_tolerance(self):
+        """
+        Expect rounding noise in percentages and differences in text formatting not to count as mismatches.
+        """
+        self.company_data2 = CompanyData(**test_company_data)
+        self.company_data2.roe = Decimal('13.330')
+        self.company_data2.ebitda_margin = Decimal('40.004')
+        self.company_data2.location = 'new york ny'
+        self.company_data2.ceo = ' Jane  Smith'
+
+        result = get_mismatched_fields(stored_data=self.company_data1, extracted_data=self.company_data2)
+
+        self.assertEqual(result, [])
+
+    def test_get_mismatched_fields_outside_tolerance(self):
+        """
+        Expect differences larger than the tolerance to be reported.
+        """
+        self.company_data2 = CompanyData(**test_company_data)
+        self.company_data2.ebitda_margin = Decimal('40.02')
+
+        result = get_mismatched_fields(stored_data=self.company_data1, extracted_data=self.company_data2)
+
+        self.assertEqual([f.field_name for f in result], ['ebitda_margin'])
+
+    def test_get_mismatched_fields_one_unit_at_two_decimal_places(self):
+        """
+        Expect a 0.01 difference in percentages and ratios to be reported.
+        """
+        self.company_data2 = CompanyData(**test_company_data)
+        self.company_data2.roe = self.company_data1.roe + Decimal('0.01')
+        self.company_data2.pe_ratio = self.company_data1.pe_ratio + Decimal('0.01')
+        self.company_data2.debt_to_equity_ratio = self.company_data1.debt_to_equity_ratio + Decimal('0.01')
+
+        result = get_mismatched_fields(stored_data=self.company_data1, extracted_data=self.company_data2)
+
+        self.assertEqual([f.field_name for f in result], ['pe_ratio', 'roe', 'debt_to_equity_ratio'])
+
     @patch("src.data_discrepancy_checker.get_mismatched_fields")
     def test_validate_company_data(self, mock_get_mismatched_fields):
         """
@@ -114,6 +426,132 @@ class TestDataDiscrepancyChecker(unittest.TestCase):
         self.assertEqual(result, expected_result)
 
 
+class TestValidationResultStore(unittest.TestCase):
+    def setUp(self):
+        self.store = ValidationResultStore(max_entries=10)
+        self.extracted = CompanyData(**test_company_data)
+        self.stored = CompanyData(**test_company_data)
+        self.store.record('TechCorp', self.extracted, self.stored,
+                          validate_company_data(extracted_data=self.extracted, stored_data=self.stored))
+
+    def test_get_unchanged(self):
+        """
+        Expect the previous result to be reused only when extracted and stored data are unchanged.
+        """
+        restated = self.stored.model_copy(update={'market_capitalization': Decimal('6000')})
+
+        self.assertIsNotNone(self.store.get_unchanged(' techcorp', self.extracted, CompanyData(**test_company_data)))
+        self.assertIsNone(self.store.get_unchanged('TechCorp', self.extracted, restated))
+
+    @patch('src.revalidation.validate_company_data', wraps=validate_company_data)
+    def test_stored_data_changed_revalidates_affected_companies(self, mock_validate_company_data):
+        """
+        Expect only companies with kept results to be re-validated, and the new results to be published.
+        """
+        published = []
+        self.store.subscribe(published.append)
+        restated = self.stored.model_copy(update={'location': 'Austin'})
+
+        self.store.stored_data_changed({'techcorp': restated, 'retailco': self.stored})
+        self.store.wait()
+
+        mock_validate_company_data.assert_called_once_with(extracted_data=self.extracted, stored_data=restated)
+        self.assertEqual([field.field_name for field in published[0]['TechCorp'].mismatched_fields], ['location'])
+        self.assertIs(self.store.results()['TechCorp'], published[0]['TechCorp'])
+
+    def test_stored_data_changed_drops_removed_companies(self):
+        """
+        Expect results for companies removed from the stored data to be dropped.
+        """
+        self.store.stored_data_changed({'techcorp': None})
+        self.store.wait()
+
+        self.assertEqual(self.store.results(), {})
+
+    def test_stored_data_changed_returns_before_revalidating(self):
+        """
+        Expect the change to be re-validated in the background, without holding up the caller.
+        """
+        release = threading.Event()
+        restated = self.stored.model_copy(update={'location': 'Austin'})
+
+        def slow_validate(**kwargs):
+            release.wait(5)
+            return validate_company_data(**kwargs)
+
+        with patch('src.revalidation.validate_company_data', side_effect=slow_validate):
+            self.store.stored_data_changed({'techcorp': restated})
+            self.assertEqual(self.store.revalidated, 0)
+            release.set()
+            self.store.wait()
+
+        self.assertEqual(self.store.revalidated, 1)
+        self.assertEqual(self.store.results()['TechCorp'].stored_data, restated)
+
+
+class TestComparisonRules(unittest.TestCase):
+
+    def test_compile_comparators(self):
+        """
+        Expect a comparator per field in model order, leaving out ignored fields.
+        """
+        comparators = compile_comparators(CompanyData, {'ceo': FieldRule(ignore=True)}, ignore=['location'])
+
+        self.assertEqual(list(comparators), [f for f in CompanyData.model_fields if f not in ('ceo', 'location')])
+
+    def test_compile_comparators_unknown_field(self):
+        """
+        Expect ValueError for rules that don't match a model field.
+        """
+        with self.assertRaises(ValueError):
+            compile_comparators(CompanyData, {'fake_field': FieldRule(ignore=True)})
+
+    def test_tolerance(self):
+        """
+        Expect values to match if within either the absolute or relative tolerance.
+        """
+        comparators = compile_comparators(CompanyData, {
+            'revenue': FieldRule(rel_tolerance=Decimal('0.01')),
+            'roe': FieldRule(abs_tolerance=Decimal('0.5')),
+        })
+
+        self.assertFalse(comparators['revenue'](Decimal('1000'), Decimal('1009')))
+        self.assertTrue(comparators['revenue'](Decimal('1000'), Decimal('1011')))
+        self.assertFalse(comparators['roe'](Decimal('13'), Decimal('13.5')))
+        self.assertTrue(comparators['roe'](Decimal('13'), None))
+        self.assertFalse(comparators['roe'](None, None))
+
+
+class TestBulkMismatches(unittest.TestCase):
+    def setUp(self):
+        self.stored = [CompanyData(**test_company_data) for _ in range(3)]
+        self.extracted = [CompanyData(**test_company_data) for _ in range(3)]
+        self.extracted[1].revenue = Decimal(111)
+        self.extracted[1].location = 'Boston'
+        self.extracted[2].ceo = None
+
+    def test_get_bulk_mismatches(self):
+        """
+        Expect bulk comparison to report the same mismatches as comparing each pair individually.
+        """
+        result = get_bulk_mismatches(extracted_records=self.extracted, stored_records=self.stored)
+
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result.mismatched_rows(), [1, 2])
+        self.assertEqual(result.mismatched_field_names(1), ['revenue', 'location'])
+        self.assertEqual(result.mismatch_counts()['revenue'], 1)
+        for row in range(3):
+            self.assertEqual(result.mismatched_fields(row),
+                             get_mismatched_fields(extracted_data=self.extracted[row], stored_data=self.stored[row]))
+
+    def test_get_bulk_mismatches_length_mismatch(self):
+        """
+        Expect ValueError when the number of extracted and stored records differ.
+        """
+        with self.assertRaises(ValueError):
+            get_bulk_mismatches(extracted_records=self.extracted, stored_records=self.stored[:2])
+
+
 @patch('main.validate_company_data')
 @patch('main.extract_and_parse_pdf_data')
 @patch('main.load_company_data')
@@ -122,6 +560,7 @@ class TestAPI(unittest.TestCase):
 
     def setUp(self):
         self.file_like = io.BytesIO(b'fake pdf file.')
+        validation_results.clear()
 
     def test_validate_pdf_company_data(self, mock_load_company_data, mock_extract_and_parse_pdf_data,
                                        mock_validate_company_data):
@@ -165,6 +604,72 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(resp.json(), exp_res)
         self.assertEqual(resp.status_code, 200)
 
+    def validate_with_view(self, mock_load_company_data, mock_extract_and_parse_pdf_data, mock_validate_company_data,
+                           params):
+        stored_data = CompanyData(**test_company_data)
+        uploaded_data = stored_data.model_copy(update={'industry': 'Retail', 'location': 'Boston, MA'})
+        mock_load_company_data.return_value = stored_data
+        mock_extract_and_parse_pdf_data.return_value = uploaded_data
+        mock_validate_company_data.return_value = DataDiscrepancyCheckerResponse(
+            uploaded_data=uploaded_data, stored_data=stored_data, mismatched_fields=[
+                MismatchedFields(field_name='industry', uploaded_value='Retail', stored_value='Healthcare'),
+                MismatchedFields(field_name='location', uploaded_value='Boston, MA', stored_value='New York, NY')])
+
+        return self.client.post(
+            '/company/validate-pdf-data',
+            params={'company_name': 'HealthInc', **params},
+            files={'data_file': ('test_file.txt', self.file_like, 'application/pdf')}
+        )
+
+    def test_validate_pdf_company_data_mismatches_view(self, *mocks):
+        """
+        Expect only mismatched fields with view=mismatches.
+        """
+        resp = self.validate_with_view(*mocks, params={'view': 'mismatches'})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {'mismatched_fields': [
+            {'field_name': 'industry', 'uploaded_value': 'Retail', 'stored_value': 'Healthcare'},
+            {'field_name': 'location', 'uploaded_value': 'Boston, MA', 'stored_value': 'New York, NY'}]})
+
+    def test_validate_pdf_company_data_summary_view(self, *mocks):
+        """
+        Expect match status and mismatched field names, limited to the requested fields, with view=summary.
+        """
+        resp = self.validate_with_view(*mocks, params={'view': 'summary', 'fields': ['location', 'ceo']})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {'company_name': 'HealthInc', 'status': 'mismatch',
+                                       'mismatched_fields': ['location']})
+
+    def test_validate_pdf_company_data_fields(self, *mocks):
+        """
+        Expect company data and mismatches limited to the requested fields.
+        """
+        resp = self.validate_with_view(*mocks, params={'fields': ['company_name', 'industry']})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {
+            'uploaded_data': {'company_name': 'HealthInc', 'industry': 'Retail'},
+            'stored_data': {'company_name': 'HealthInc', 'industry': 'Healthcare'},
+            'mismatched_fields': [
+                {'field_name': 'industry', 'uploaded_value': 'Retail', 'stored_value': 'Healthcare'}]})
+
+    def test_validate_pdf_company_data_unknown_field(self, mock_load_company_data, mock_extract_and_parse_pdf_data,
+                                                     mock_validate_company_data):
+        """
+        Expect error response, before any lookup, for fields that aren't company data fields.
+        """
+        resp = self.client.post(
+            '/company/validate-pdf-data',
+            params={'company_name': 'HealthInc', 'fields': ['industry', 'Industry']},
+            files={'data_file': ('test_file.txt', self.file_like, 'application/pdf')}
+        )
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(), {'error': 'Unknown fields: Industry.'})
+        mock_load_company_data.assert_not_called()
+
     def test_validate_pdf_company_data_return_data_error(self, mock_load_company_data, mock_extract_and_parse_pdf_data,
                                                          mock_validate_company_data):
         """
@@ -201,15 +706,1054 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(resp.json(), {"error": "fake ex"})
         self.assertEqual(resp.status_code, 400)
 
+    def test_validate_pdf_company_data_return_timeout_error(self, mock_load_company_data,
+                                                            mock_extract_and_parse_pdf_data,
+                                                            mock_validate_company_data):
+        """
+        Expect gateway timeout response if extraction takes longer than the configured timeout.
+        """
 
-class TestPdfServiceCaller(unittest.TestCase):
-    @patch('pdf_service_api.PdfService.extract')
-    def test_extract_and_parse_pdf_data(self, mock_extract):
-        mock_extract.return_value = test_company_data
+        mock_load_company_data.return_value = 'fake data'
+        mock_extract_and_parse_pdf_data.side_effect = lambda **kwargs: time.sleep(0.2)
 
-        extract_and_parse_pdf_data(company_name='FakeCompany', pdf_file='Fake File')
+        with patch.object(extraction_client, 'timeout', 0.01):
+            resp = self.client.post(
+                '/company/validate-pdf-data',
+                params={'company_name': 'fake company name'},
+                files={'data_file': ('test_file.txt', self.file_like, 'application/pdf')}
+            )
 
-        mock_extract.assert_called_once_with(file_path="assets/fakecompany.pdf")
+        self.assertEqual(resp.json(), {"error": "PDF extraction timed out."})
+        self.assertEqual(resp.status_code, 504)
+        mock_validate_company_data.assert_not_called()
+
+    def test_validate_pdf_company_data_return_pool_timeout_error(self, mock_load_company_data,
+                                                                 mock_extract_and_parse_pdf_data,
+                                                                 mock_validate_company_data):
+        """
+        Expect gateway timeout response if no pdf service client is free within the pool timeout.
+        """
+        pool = PdfServicePool(key='TEST_KEY', max_size=0, timeout=0)
+
+        def extract(**kwargs):
+            with pool.acquire():
+                pass
+
+        mock_load_company_data.return_value = 'fake data'
+        mock_extract_and_parse_pdf_data.side_effect = extract
+
+        resp = self.client.post(
+            '/company/validate-pdf-data',
+            params={'company_name': 'fake company name'},
+            files={'data_file': ('test_file.txt', self.file_like, 'application/pdf')}
+        )
+
+        self.assertEqual(resp.json(), {"error": "PDF extraction timed out."})
+        self.assertEqual(resp.status_code, 504)
+        mock_validate_company_data.assert_not_called()
+
+
+@patch('main.extract_and_parse_pdf_data')
+@patch('main.load_company_data')
+class TestUploadAPI(unittest.TestCase):
+    client = TestClient(app)
+
+    def setUp(self):
+        validation_results.clear()
+
+    def test_validate_pdf_company_data_upload(self, mock_load_company_data, mock_extract_and_parse_pdf_data):
+        """
+        Expect a raw pdf body to be validated, with its digest handed to extraction.
+        """
+        mock_load_company_data.return_value = CompanyData(**test_company_data)
+        mock_extract_and_parse_pdf_data.return_value = CompanyData(**test_company_data)
+
+        response = self.client.post('/company/validate-pdf-data/upload', params={'company_name': 'TechCorp'},
+                                    content=b'fake pdf file.', headers={'Content-Type': 'application/pdf'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['mismatched_fields'], [])
+        self.assertEqual(mock_extract_and_parse_pdf_data.call_args.kwargs['pdf_digest'],
+                         hashlib.sha256(b'fake pdf file.').hexdigest())
+
+    def test_upload_rejected_by_content_length(self, mock_load_company_data, mock_extract_and_parse_pdf_data):
+        """
+        Expect a body declared over the size limit to be rejected before the handler runs.
+        """
+        with patch.object(settings, 'max_upload_bytes', 10):
+            response = self.client.post('/company/validate-pdf-data/upload', params={'company_name': 'TechCorp'},
+                                        content=b'fake pdf file.')
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json(), {'error': 'Uploaded file is too large.'})
+        mock_load_company_data.assert_not_called()
+
+    def test_chunked_upload_rejected_once_over_limit(self, mock_load_company_data,
+                                                     mock_extract_and_parse_pdf_data):
+        """
+        Expect a body without a content length to be rejected once it goes over the size limit.
+        """
+        mock_load_company_data.return_value = CompanyData(**test_company_data)
+
+        with patch.object(settings, 'max_upload_bytes', 10):
+            response = self.client.post('/company/validate-pdf-data/upload', params={'company_name': 'TechCorp'},
+                                        content=iter([b'fake pdf', b' file.']))
+
+        self.assertEqual(response.status_code, 413)
+        mock_extract_and_parse_pdf_data.assert_not_called()
+
+    def test_multipart_upload_rejected_over_limit(self, mock_load_company_data, mock_extract_and_parse_pdf_data):
+        """
+        Expect the size limit to apply to multipart uploads too.
+        """
+        with patch.object(settings, 'max_upload_bytes', 10):
+            response = self.client.post('/company/validate-pdf-data', params={'company_name': 'TechCorp'},
+                                        files={'data_file': ('test_file.pdf', io.BytesIO(b'fake pdf file.'))})
+
+        self.assertEqual(response.status_code, 413)
+        mock_load_company_data.assert_not_called()
+
+    def test_receive_pdf_upload_spools_large_files(self, *_mocks):
+        """
+        Expect uploads to be written in memory up to the spool size, then to disk from a thread, and to be hashed
+        across all chunks.
+        """
+        async def chunks():
+            yield b'a' * 10
+            yield b'b' * 10
+            yield b'c' * 10
+
+        with patch('src.uploads.run_in_threadpool', wraps=run_in_threadpool) as mock_run_in_threadpool:
+            upload = asyncio.run(receive_pdf_upload(chunks(), spool_max_bytes=15))
+        try:
+            self.assertEqual([call.args[1] for call in mock_run_in_threadpool.call_args_list], [b'b' * 10, b'c' * 10])
+            self.assertEqual(upload.size, 30)
+            self.assertEqual(upload.pdf_digest, hashlib.sha256(b'a' * 10 + b'b' * 10 + b'c' * 10).hexdigest())
+            self.assertEqual(upload.pdf_file.read(), b'a' * 10 + b'b' * 10 + b'c' * 10)
+        finally:
+            upload.close()
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_render(self):
+        """
+        Expect histograms to render cumulative buckets, sum and count in the Prometheus text format.
+        """
+        histogram = Histogram('fake_seconds', 'Fake histogram.', ['stage'], buckets=(0.1, 1.0))
+        histogram.observe(0.05, 'a')
+        histogram.observe(0.5, 'a')
+        histogram.observe(5, 'a')
+
+        self.assertEqual(histogram.render(), [
+            '# HELP fake_seconds Fake histogram.',
+            '# TYPE fake_seconds histogram',
+            'fake_seconds_bucket{stage="a",le="0.1"} 1',
+            'fake_seconds_bucket{stage="a",le="1.0"} 2',
+            'fake_seconds_bucket{stage="a",le="+Inf"} 3',
+            'fake_seconds_sum{stage="a"} 5.55',
+            'fake_seconds_count{stage="a"} 3',
+        ])
+
+    def test_label_values_escaped(self):
+        """
+        Expect backslashes, quotes and newlines in label values to be escaped.
+        """
+        counter = Counter('fake_total', 'Fake counter.', ['path'])
+        counter.inc('/a"b\\c\nd')
+
+        self.assertEqual(counter.render()[-1], 'fake_total{path="/a\\"b\\\\c\\nd"} 1')
+
+    def test_track_request_logs_slow_request(self):
+        """
+        Expect requests slower than the threshold to log their stage breakdown.
+        """
+        with self.assertLogs('src.metrics', level='WARNING') as logs:
+            with track_request('/fake', slow_threshold=0):
+                with stage_timer('fake_stage'):
+                    pass
+
+        self.assertIn('Slow request /fake', logs.output[0])
+        self.assertIn('fake_stage=', logs.output[0])
+
+
+class TestMetricsAPI(unittest.TestCase):
+    client = TestClient(app)
+
+    def test_metrics(self):
+        """
+        Expect stage timings and request counts to be exposed after a validation request.
+        """
+        self.client.post(
+            '/company/validate-pdf-data',
+            params={'company_name': 'HealthInc'},
+            files={'data_file': ('test_file.pdf', io.BytesIO(b'metrics pdf'), 'application/pdf')}
+        )
+
+        resp = self.client.get('/metrics')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers['content-type'].startswith('text/plain'))
+        for stage in ('load_stored_data', 'pdf_extract', 'compare'):
+            self.assertIn(f'validation_stage_seconds_count{{stage="{stage}"}}', resp.text)
+        self.assertIn('validation_requests_total{path="/company/validate-pdf-data",status="200"}', resp.text)
+        self.assertIn('extraction_cache_hit_ratio', resp.text)
+
+    def test_metrics_label_unmatched_paths(self):
+        """
+        Expect requests to unknown paths to share one path label rather than each adding a new one.
+        """
+        self.client.get('/company/foo"bar')
+        self.client.get('/company/another-unknown-path')
+
+        resp = self.client.get('/metrics')
+
+        self.assertIn('validation_requests_total{path="unmatched",status="404"}', resp.text)
+        self.assertNotIn('foo', resp.text)
+        self.assertNotIn('another-unknown-path', resp.text)
+
+
+class TestHealthAPI(unittest.TestCase):
+    client = TestClient(app)
+
+    def test_health(self):
+        """
+        Expect health endpoint to report pdf service pool status.
+        """
+        resp = self.client.get('/health')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.json()['pdf_service_pool']['healthy'])
+
+    def test_startup_fails_on_unknown_ignore_fields(self):
+        """
+        Expect the app to refuse to start if COMPARISON_IGNORE_FIELDS names a field that doesn't exist.
+        """
+        get_comparators.cache_clear()
+        try:
+            with patch.object(settings, 'comparison_ignore_fields', ['fake_field']):
+                with self.assertRaises(ValueError):
+                    with TestClient(app):
+                        pass
+        finally:
+            get_comparators.cache_clear()
+
+
+@patch('main.validate_company_data')
+@patch('main.extract_and_parse_pdf_data')
+@patch('main.load_many_company_data')
+class TestBatchAPI(unittest.TestCase):
+    client = TestClient(app)
+
+    def setUp(self):
+        validation_results.clear()
+
+    def post_batch(self, company_names, file_count):
+        return self.client.post(
+            '/company/validate-pdf-data/batch',
+            params={'company_names': company_names},
+            files=[('data_files', (f'test_file_{i}.pdf', io.BytesIO(b'fake pdf file.'), 'application/pdf'))
+                   for i in range(file_count)]
+        )
+
+    def test_validate_pdf_company_data_batch(self, mock_load_many_company_data, mock_extract_and_parse_pdf_data,
+                                             mock_validate_company_data):
+        """
+        Expect one result per item, with per-item errors reported inline rather than failing the batch.
+        """
+        mock_company_data = CompanyData(**test_company_data)
+        mock_load_many_company_data.return_value = {'HealthInc': mock_company_data, 'Fake Company': None,
+                                                    'RetailCo': mock_company_data}
+        mock_extract_and_parse_pdf_data.side_effect = lambda company_name, pdf_file, pdf_digest: (
+            mock_company_data if company_name == 'HealthInc' else self.fail_extraction())
+        mock_validate_company_data.return_value = DataDiscrepancyCheckerResponse(
+            stored_data=mock_company_data, uploaded_data=mock_company_data, mismatched_fields=[])
+
+        resp = self.post_batch([' HealthInc', 'Fake Company', 'RetailCo'], 3)
+
+        self.assertEqual(resp.status_code, 200)
+        mock_load_many_company_data.assert_called_once_with(['HealthInc', 'Fake Company', 'RetailCo'])
+        result = resp.json()
+        self.assertEqual([item['company_name'] for item in result], ['HealthInc', 'Fake Company', 'RetailCo'])
+        self.assertEqual(result[0]['error'], None)
+        self.assertEqual(result[0]['result']['mismatched_fields'], [])
+        self.assertEqual(result[1], {'company_name': 'Fake Company', 'result': None,
+                                     'error': 'No data found for this company name.'})
+        self.assertEqual(result[2], {'company_name': 'RetailCo', 'result': None, 'error': 'fake ex'})
+
+    def test_validate_pdf_company_data_batch_unexpected_errors(self, mock_load_many_company_data,
+                                                               mock_extract_and_parse_pdf_data,
+                                                               mock_validate_company_data):
+        """
+        Expect invalid extracted data and unexpected exceptions to be reported inline, not fail the batch.
+        """
+        mock_company_data = CompanyData(**test_company_data)
+        mock_load_many_company_data.return_value = {'HealthInc': mock_company_data, 'RetailCo': mock_company_data,
+                                                    'TechCorp': mock_company_data}
+        failures = {'RetailCo': lambda: CompanyData(**{'Company Name': 'RetailCo'}),
+                    'TechCorp': lambda: 1 / 0}
+        mock_extract_and_parse_pdf_data.side_effect = lambda company_name, pdf_file, pdf_digest: (
+            failures[company_name]() if company_name in failures else mock_company_data)
+        mock_validate_company_data.return_value = DataDiscrepancyCheckerResponse(
+            stored_data=mock_company_data, uploaded_data=mock_company_data, mismatched_fields=[])
+
+        with self.assertLogs('main', level='ERROR'):
+            resp = self.post_batch(['HealthInc', 'RetailCo', 'TechCorp'], 3)
+
+        self.assertEqual(resp.status_code, 200)
+        result = resp.json()
+        self.assertEqual(result[0]['result']['mismatched_fields'], [])
+        self.assertEqual(result[1], {'company_name': 'RetailCo', 'result': None,
+                                     'error': 'Extracted pdf data is invalid.'})
+        self.assertEqual(result[2], {'company_name': 'TechCorp', 'result': None, 'error': 'Validation failed.'})
+
+    def test_validate_pdf_company_data_batch_length_mismatch(self, mock_load_many_company_data,
+                                                             mock_extract_and_parse_pdf_data,
+                                                             mock_validate_company_data):
+        """
+        Expect error response if the number of company names and files differ.
+        """
+        resp = self.post_batch(['HealthInc', 'RetailCo'], 1)
+
+        self.assertEqual(resp.json(), {"error": "Expected one company name per file."})
+        self.assertEqual(resp.status_code, 400)
+        mock_load_many_company_data.assert_not_called()
+
+    @staticmethod
+    def fail_extraction():
+        raise FileNotFoundError('fake ex')
+
+
+class TestStreamAPI(unittest.TestCase):
+    client = TestClient(app)
+
+    def setUp(self):
+        validation_results.clear()
+
+    def post_stream(self, company_names, **params):
+        return self.client.post(
+            '/company/validate-pdf-data/stream',
+            params={'company_names': company_names, **params},
+            files=[('data_files', (f'{name}.pdf', io.BytesIO(name.encode()), 'application/pdf'))
+                   for name in company_names]
+        )
+
+    def test_validate_pdf_company_data_stream(self):
+        """
+        Expect one ndjson line per company, with per-item errors inline.
+        """
+        resp = self.post_stream(['HealthInc', 'Fake Company'])
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['content-type'], 'application/x-ndjson')
+        lines = {item['company_name']: item for item in map(json.loads, resp.text.splitlines())}
+        self.assertEqual(set(lines), {'HealthInc', 'Fake Company'})
+        self.assertEqual(lines['Fake Company']['error'], 'No data found for this company name.')
+        self.assertEqual(lines['HealthInc']['result']['uploaded_data']['equity'], '666')
+        self.assertIn('equity', [f['field_name'] for f in lines['HealthInc']['result']['mismatched_fields']])
+
+    @patch('pdf_service_api.PdfService.extract')
+    def test_validate_pdf_company_data_stream_invalid_extraction(self, mock_extract):
+        """
+        Expect a malformed extraction payload to be reported inline, and the rest of the stream to complete.
+        """
+        mock_extract.side_effect = lambda file_path: (
+            {'Company Name': 'RetailCo'} if 'retailco' in file_path else test_company_data)
+        extraction_cache.clear()
+
+        with self.assertLogs('main', level='ERROR'):
+            resp = self.post_stream(['HealthInc', 'RetailCo'])
+
+        lines = {item['company_name']: item for item in map(json.loads, resp.text.splitlines())}
+        self.assertEqual(lines['RetailCo']['error'], 'Extracted pdf data is invalid.')
+        self.assertIsNone(lines['HealthInc']['error'])
+
+    def test_validate_pdf_company_data_stream_mismatches_only(self):
+        """
+        Expect full records to be left out when mismatches_only is set.
+        """
+        resp = self.post_stream(['HealthInc'], mismatches_only=True)
+
+        line = json.loads(resp.text)
+        self.assertEqual(list(line['result']), ['mismatched_fields'])
+
+    def test_validate_pdf_company_data_stream_length_mismatch(self):
+        """
+        Expect error response if the number of company names and files differ.
+        """
+        resp = self.client.post(
+            '/company/validate-pdf-data/stream',
+            params={'company_names': ['HealthInc', 'RetailCo']},
+            files=[('data_files', ('test_file.pdf', io.BytesIO(b'fake pdf file.'), 'application/pdf'))]
+        )
+
+        self.assertEqual(resp.status_code, 400)
+
+
+class TestPdfServiceCaller(unittest.TestCase):
+    @patch('pdf_service_api.PdfService.extract')
+    def test_extract_and_parse_pdf_data(self, mock_extract):
+        mock_extract.return_value = test_company_data
+
+        extract_and_parse_pdf_data(company_name='FakeCompany', pdf_file='Fake File')
+
+        mock_extract.assert_called_once_with(file_path="assets/fakecompany.pdf")
+
+    @patch('pdf_service_api.PdfService.extract')
+    def test_extract_and_parse_pdf_data_cached(self, mock_extract):
+        """
+        Expect repeat uploads of the same pdf to be served from the cache, and different pdfs to be extracted.
+        """
+        extraction_cache.clear()
+        mock_extract.return_value = test_company_data
+
+        first = extract_and_parse_pdf_data(company_name='HealthInc', pdf_file=io.BytesIO(b'pdf one'))
+        second = extract_and_parse_pdf_data(company_name='HealthInc', pdf_file=io.BytesIO(b'pdf one'))
+        extract_and_parse_pdf_data(company_name='HealthInc', pdf_file=io.BytesIO(b'pdf two'))
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_extract.call_count, 2)
+        self.assertEqual(extraction_cache.stats()['memory_hits'], 1)
+        self.assertEqual(extraction_cache.stats()['misses'], 2)
+
+
+class TestSharedCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        path = os.path.join(self.cache_dir, 'shared.db')
+        # two caches on the same file stand in for two worker processes
+        self.worker_one = SharedCache(path, max_entries=10)
+        self.worker_two = SharedCache(path, max_entries=10)
+
+    def tearDown(self):
+        self.worker_one.close()
+        self.worker_two.close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_entries_shared_between_workers(self):
+        """
+        Expect a value stored by one worker to be visible to another.
+        """
+        generation = self.worker_one.generation(EXTRACTION_NAMESPACE)
+        self.assertTrue(self.worker_one.set(EXTRACTION_NAMESPACE, 'key', 'value', generation))
+
+        self.assertEqual(self.worker_two.get(EXTRACTION_NAMESPACE, 'key'), b'value')
+        self.assertIsNone(self.worker_two.get(STORED_DATA_NAMESPACE, 'key'))
+
+    def test_invalidate_visible_to_all_workers(self):
+        """
+        Expect an invalidation by one worker to hide entries from all, and stale writes to be rejected.
+        """
+        generation = self.worker_one.generation(STORED_DATA_NAMESPACE)
+        self.worker_one.set(STORED_DATA_NAMESPACE, 'techcorp', 'old', generation)
+
+        self.worker_two.invalidate(STORED_DATA_NAMESPACE)
+
+        self.assertIsNone(self.worker_one.get(STORED_DATA_NAMESPACE, 'techcorp'))
+        self.assertFalse(self.worker_one.set(STORED_DATA_NAMESPACE, 'techcorp', 'old', generation))
+        self.assertIsNone(self.worker_two.get(STORED_DATA_NAMESPACE, 'techcorp'))
+
+    def test_evicts_oldest_writes(self):
+        """
+        Expect entries to be evicted once more than max_entries have been written.
+        """
+        cache = SharedCache(os.path.join(self.cache_dir, 'small.db'), max_entries=2)
+        generation = cache.generation(EXTRACTION_NAMESPACE)
+        for key in ['one', 'two', 'three']:
+            cache.set(EXTRACTION_NAMESPACE, key, key, generation)
+
+        self.assertIsNone(cache.get(EXTRACTION_NAMESPACE, 'one'))
+        self.assertEqual(cache.get(EXTRACTION_NAMESPACE, 'three'), b'three')
+        cache.close()
+
+    def test_evicts_per_namespace(self):
+        """
+        Expect writes to one namespace not to evict entries from another.
+        """
+        generation = self.worker_one.generation(EXTRACTION_NAMESPACE)
+        for key in range(5):
+            self.worker_one.set(EXTRACTION_NAMESPACE, str(key), 'pdf', generation)
+        self.worker_one.load(STORED_DATA_NAMESPACE, {str(key): 'company' for key in range(8)},
+                             self.worker_one.generation(STORED_DATA_NAMESPACE))
+        self.worker_one.set(EXTRACTION_NAMESPACE, '5', 'pdf', generation)
+
+        self.assertEqual(len(self.worker_two.get_many(EXTRACTION_NAMESPACE, [str(key) for key in range(6)])), 6)
+        self.assertEqual(len(self.worker_two.get_many(STORED_DATA_NAMESPACE, [str(key) for key in range(8)])), 8)
+
+    def test_load_company_data_uses_shared_cache(self):
+        """
+        Expect stored data cached by one worker to be served without hitting the storage backend.
+        """
+        with patch('src.data_layer.get_shared_cache', return_value=self.worker_one), \
+                patch('src.data_layer._local_records', _LocalRecords()):
+            expected = load_company_data('TechCorp')
+            with patch.object(CsvCompanyBackend, 'get') as mock_get:
+                result = load_company_data(' techcorp')
+
+        self.assertEqual(result, expected)
+        mock_get.assert_not_called()
+
+    def test_stored_data_loaded_once_for_all_workers(self):
+        """
+        Expect the first worker to miss to load the shared cache in one pass, and no worker to build its own index.
+        """
+        backend = CsvCompanyBackend(settings.db_location)
+        expected = backend.get('TechCorp')
+        backend = CsvCompanyBackend(settings.db_location)
+
+        with patch('src.data_layer.get_storage_backend', return_value=backend), \
+                patch.object(backend, 'scan', wraps=backend.scan) as mock_scan:
+            results = []
+            for worker in [self.worker_one, self.worker_two]:
+                with patch('src.data_layer.get_shared_cache', return_value=worker), \
+                        patch('src.data_layer._local_records', _LocalRecords()):
+                    results.append(load_company_data(' techcorp'))
+                    results.append(load_company_data('Fake Company'))
+
+        self.assertEqual(results, [expected, None, expected, None])
+        mock_scan.assert_called_once()
+        self.assertEqual(backend._index, {})
+
+    def test_load_many_company_data_uses_shared_cache(self):
+        """
+        Expect batch lookups to be served from the shared cache, without building a per worker index.
+        """
+        backend = CsvCompanyBackend(settings.db_location)
+        expected = CsvCompanyBackend(settings.db_location).get_many(['TechCorp', ' techcorp', 'Fake Company'])
+
+        with patch('src.data_layer.get_storage_backend', return_value=backend), \
+                patch('src.data_layer.get_shared_cache', return_value=self.worker_one), \
+                patch('src.data_layer._local_records', _LocalRecords()):
+            result = load_many_company_data(['TechCorp', ' techcorp', 'Fake Company'])
+
+        self.assertEqual(result, expected)
+        self.assertEqual(backend._index, {})
+
+    def test_revalidates_stored_data_changes(self):
+        """
+        Expect every worker to re-validate its kept results when another worker loads changed stored data.
+        """
+        db_location = os.path.join(self.cache_dir, 'database.csv')
+        shutil.copy(settings.db_location, db_location)
+        backend = CsvCompanyBackend(db_location)
+        stores = [ValidationResultStore(max_entries=10), ValidationResultStore(max_entries=10)]
+        workers = [(self.worker_one, _LocalRecords()), (self.worker_two, _LocalRecords())]
+
+        def as_worker(number):
+            shared_cache, local_records = workers[number]
+            return [patch('src.data_layer.get_shared_cache', return_value=shared_cache),
+                    patch('src.data_layer._local_records', local_records),
+                    patch('src.data_layer._change_listeners', [stores[number].stored_data_changed])]
+
+        with patch('src.data_layer.get_storage_backend', return_value=backend):
+            for number in range(2):
+                with contextlib.ExitStack() as stack:
+                    for patcher in as_worker(number):
+                        stack.enter_context(patcher)
+                    stored = load_company_data('HealthInc')
+                    extracted = stored.model_copy(update={'location': 'Boston'})
+                    stores[number].record('HealthInc', extracted, stored,
+                                          validate_company_data(extracted_data=extracted, stored_data=stored))
+
+            with open(db_location) as f:
+                csv_data = f.read()
+            with open(db_location, 'w') as f:
+                f.write(csv_data.replace('0.25,New York', '0.25,Boston'))
+            os.utime(db_location, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+
+            for number in range(2):
+                with contextlib.ExitStack() as stack:
+                    for patcher in as_worker(number):
+                        stack.enter_context(patcher)
+                    refresh_stored_data()
+                stores[number].wait()
+
+        for store in stores:
+            self.assertEqual(store.results()['HealthInc'].mismatched_fields, [])
+        self.assertEqual(backend._index, {})
+
+    def test_sync_source_invalidates_on_new_version(self):
+        """
+        Expect a namespace to be invalidated when the data version changes, but not when a worker starts up.
+        """
+        self.assertTrue(self.worker_one.sync_source(STORED_DATA_NAMESPACE, 'v1'))
+        self.worker_one.load(STORED_DATA_NAMESPACE, {'techcorp': 'old'},
+                             self.worker_one.generation(STORED_DATA_NAMESPACE))
+
+        self.assertFalse(self.worker_two.sync_source(STORED_DATA_NAMESPACE, 'v1'))
+        self.assertEqual(self.worker_two.get(STORED_DATA_NAMESPACE, 'techcorp'), b'old')
+        self.assertTrue(self.worker_two.is_loaded(STORED_DATA_NAMESPACE))
+
+        self.assertTrue(self.worker_two.sync_source(STORED_DATA_NAMESPACE, 'v2'))
+        self.assertIsNone(self.worker_one.get(STORED_DATA_NAMESPACE, 'techcorp'))
+        self.assertFalse(self.worker_one.is_loaded(STORED_DATA_NAMESPACE))
+
+    def test_load_records_changes(self):
+        """
+        Expect each load to record the keys changed since the previous load, for workers that saw either load.
+        """
+        self.worker_one.sync_source(STORED_DATA_NAMESPACE, 'v1')
+        self.worker_one.load(STORED_DATA_NAMESPACE, {'techcorp': 'old', 'retailco': 'same', 'healthinc': 'gone'},
+                             self.worker_one.generation(STORED_DATA_NAMESPACE))
+        first, changes = self.worker_one.changes_since(STORED_DATA_NAMESPACE, None)
+        self.assertIsNone(changes)
+
+        self.worker_two.sync_source(STORED_DATA_NAMESPACE, 'v2')
+        self.worker_two.load(STORED_DATA_NAMESPACE, {'techcorp': 'new', 'retailco': 'same', 'newcorp': 'added'},
+                             self.worker_two.generation(STORED_DATA_NAMESPACE))
+
+        second, changes = self.worker_one.changes_since(STORED_DATA_NAMESPACE, first)
+        self.assertEqual(changes, {'techcorp': b'new', 'newcorp': b'added', 'healthinc': None})
+        self.assertEqual(self.worker_one.changes_since(STORED_DATA_NAMESPACE, second), (second, {}))
+
+    @patch('pdf_service_api.PdfService.extract')
+    def test_extraction_shared_between_workers(self, mock_extract):
+        """
+        Expect an extraction made by one worker to be reused by another with an empty local cache.
+        """
+        mock_extract.return_value = test_company_data
+        with patch('src.pdf_service_api.get_shared_cache', return_value=self.worker_one):
+            extraction_cache.clear()
+            first = extract_and_parse_pdf_data(company_name='HealthInc', pdf_file=io.BytesIO(b'shared pdf'))
+            extraction_cache.clear()
+            second = extract_and_parse_pdf_data(company_name='HealthInc', pdf_file=io.BytesIO(b'shared pdf'))
+
+        self.assertEqual(first, second)
+        mock_extract.assert_called_once()
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_coalesced(self):
+        """
+        Expect concurrent calls with the same key to share one call, and calls with other keys to run separately.
+        """
+        single_flight = SingleFlight('test')
+        calls = []
+
+        async def work(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return object()
+
+        async def run_all():
+            return await asyncio.gather(*(single_flight.run(key, work, key) for key in ['a', 'a', 'a', 'b']))
+
+        results = asyncio.run(run_all())
+
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertIs(results[0], results[2])
+        self.assertIsNot(results[0], results[3])
+
+    def test_exceptions_shared_and_not_cached(self):
+        """
+        Expect every waiting caller to get the exception, and the next call to start afresh.
+        """
+        single_flight = SingleFlight('test')
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise FileNotFoundError('fake ex')
+
+        async def run_all():
+            return await asyncio.gather(single_flight.run('a', work), single_flight.run('a', work),
+                                        return_exceptions=True)
+
+        first = asyncio.run(run_all())
+        second = asyncio.run(run_all())
+
+        self.assertTrue(all(isinstance(result, FileNotFoundError) for result in first + second))
+        self.assertEqual(len(calls), 2)
+
+    @patch('main.extract_and_parse_pdf_data')
+    def test_identical_validations_share_extraction(self, mock_extract_and_parse_pdf_data):
+        """
+        Expect concurrent validations of the same company and pdf contents to share one extraction.
+        """
+        validation_results.clear()
+        company_data = CompanyData(**test_company_data)
+        mock_extract_and_parse_pdf_data.side_effect = lambda **kwargs: time.sleep(0.05) or company_data
+
+        async def validate_all():
+            return await asyncio.gather(*(
+                _extract_and_validate(company_name, company_data, io.BytesIO(pdf))
+                for company_name, pdf in [('TechCorp', b'pdf'), (' techcorp', b'pdf'), ('TechCorp', b'other pdf')]
+            ))
+
+        results = asyncio.run(validate_all())
+
+        self.assertEqual(mock_extract_and_parse_pdf_data.call_count, 2)
+        self.assertIs(results[0], results[1])
+
+
+class TestPdfServicePool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = PdfServicePool(key='TEST_KEY', max_size=1, timeout=0.01)
+
+    def test_acquire_reuses_client(self):
+        """
+        Expect a returned client to be handed out again instead of creating a new one.
+        """
+        with self.pool.acquire() as first:
+            pass
+        with self.pool.acquire() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(self.pool.health_check()['size'], 1)
+
+    def test_acquire_waits_for_free_client(self):
+        """
+        Expect asyncio.TimeoutError when all clients are in use for longer than the timeout.
+        """
+        with self.pool.acquire():
+            with self.assertRaises(asyncio.TimeoutError):
+                with self.pool.acquire():
+                    pass
+
+    def test_unhealthy_client_replaced(self):
+        """
+        Expect idle clients failing the health check to be discarded and replaced.
+        """
+        with self.pool.acquire() as first:
+            first.key = 'STALE_KEY'
+        with self.pool.acquire() as second:
+            pass
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second.key, 'TEST_KEY')
+
+    def test_close(self):
+        """
+        Expect a closed pool to drop idle clients, report unhealthy and refuse checkouts until re-opened.
+        """
+        with self.pool.acquire():
+            pass
+
+        self.pool.close()
+
+        self.assertEqual(self.pool.health_check(), {'healthy': False, 'size': 0, 'idle': 0, 'max_size': 1,
+                                                    'discarded': 0})
+        with self.assertRaises(RuntimeError):
+            with self.pool.acquire():
+                pass
+        self.pool.open()
+        with self.pool.acquire() as client:
+            self.assertEqual(client.key, 'TEST_KEY')
+
+
+class TestPreExtractionWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.watch_dir = tempfile.mkdtemp()
+        self.worker = PreExtractionWorker(workers=2, max_retries=2, backoff=0, watch_dir=self.watch_dir,
+                                          poll_interval=60)
+        self.worker.start()
+
+    def tearDown(self):
+        self.worker.stop()
+        shutil.rmtree(self.watch_dir)
+
+    def write_pdf(self, file_name, contents):
+        path = os.path.join(self.watch_dir, file_name)
+        with open(path, 'wb') as f:
+            f.write(contents)
+        return path
+
+    @patch('pdf_service_api.PdfService.extract')
+    def test_scan_pre_extracts_into_cache(self, mock_extract):
+        """
+        Expect pdfs picked up from the watch directory to be served from the cache when uploaded later.
+        """
+        extraction_cache.clear()
+        mock_extract.return_value = test_company_data
+        self.write_pdf('healthinc.pdf', b'quarterly filing')
+        self.write_pdf('notes.txt', b'not a pdf')
+
+        futures = self.worker.scan()
+        for future in futures:
+            future.result()
+        result = extract_and_parse_pdf_data(company_name='HealthInc', pdf_file=io.BytesIO(b'quarterly filing'))
+
+        self.assertEqual(len(futures), 1)
+        self.assertEqual(result, CompanyData(**test_company_data))
+        mock_extract.assert_called_once_with(file_path='assets/healthinc.pdf')
+        self.assertEqual(self.worker.scan(), [])
+
+    @patch('src.pre_extraction.extract_and_parse_pdf_data')
+    def test_enqueue_retries(self, mock_extract_and_parse_pdf_data):
+        """
+        Expect failed extractions to be retried until they succeed.
+        """
+        mock_company_data = CompanyData(**test_company_data)
+        mock_extract_and_parse_pdf_data.side_effect = [ConnectionError(), ConnectionError(), mock_company_data]
+        path = self.write_pdf('healthinc.pdf', b'quarterly filing')
+
+        with self.assertLogs('src.pre_extraction', level='WARNING'):
+            result = self.worker.enqueue(path).result()
+
+        self.assertEqual(result, mock_company_data)
+        self.assertEqual(mock_extract_and_parse_pdf_data.call_count, 3)
+        self.assertEqual(self.worker.stats(), {'completed': 1, 'failed': 0})
+
+    @patch('src.pre_extraction.extract_and_parse_pdf_data')
+    def test_enqueue_invalid_file_not_retried(self, mock_extract_and_parse_pdf_data):
+        """
+        Expect FileNotFoundError from the pdf service to fail the extraction without retrying.
+        """
+        mock_extract_and_parse_pdf_data.side_effect = FileNotFoundError('fake ex')
+        path = self.write_pdf('fakecompany.pdf', b'unknown filing')
+
+        with self.assertLogs('src.pre_extraction', level='ERROR'):
+            with self.assertRaises(FileNotFoundError):
+                self.worker.enqueue(path).result()
+
+        mock_extract_and_parse_pdf_data.assert_called_once()
+        self.assertEqual(self.worker.stats(), {'completed': 0, 'failed': 1})
+
+
+class TestExtractionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.company_data = CompanyData(**test_company_data)
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_hash_pdf_file(self):
+        """
+        Expect hash_pdf_file to digest file contents and leave the file position unchanged.
+        """
+        pdf_file = io.BytesIO(b'fake pdf file.')
+        pdf_file.seek(3)
+
+        result = hash_pdf_file(pdf_file)
+
+        self.assertEqual(result, hash_pdf_file(io.BytesIO(b'fake pdf file.')))
+        self.assertNotEqual(result, hash_pdf_file(io.BytesIO(b'other pdf file.')))
+        self.assertEqual(pdf_file.tell(), 3)
+        self.assertIsNone(hash_pdf_file('Fake File'))
+
+    def test_memory_tier_evicts_least_recently_used(self):
+        """
+        Expect the memory tier to drop the least recently used entry once full.
+        """
+        cache = ExtractionCache(max_entries=2)
+        cache.set('a', self.company_data)
+        cache.set('b', self.company_data)
+        cache.get('a')
+        cache.set('c', self.company_data)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), self.company_data)
+        self.assertEqual(cache.get('c'), self.company_data)
+        self.assertEqual(cache.stats()['memory_hits'], 3)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_disk_tier(self):
+        """
+        Expect entries evicted from memory to be served from disk.
+        """
+        cache = ExtractionCache(max_entries=1, disk_location=self.cache_dir)
+        cache.set('a', self.company_data)
+        cache.set('b', self.company_data)
+
+        self.assertEqual(cache.get('a'), self.company_data)
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+
+    def test_disk_tier_ttl(self):
+        """
+        Expect disk entries older than the ttl to be treated as missing.
+        """
+        cache = ExtractionCache(max_entries=1, disk_location=self.cache_dir, ttl=60)
+        cache.set('a', self.company_data)
+        cache.set('b', self.company_data)
+        old = time.time() - 120
+        os.utime(os.path.join(self.cache_dir, 'a.json'), (old, old))
+
+        self.assertIsNone(cache.get('a'))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'a.json')))
+
+    def test_disk_tier_size_limit(self):
+        """
+        Expect the oldest disk entries to be evicted once the size limit is exceeded, without rescanning the
+        directory on every write.
+        """
+        entry_size = len(self.company_data.model_dump_json(by_alias=True))
+        cache = ExtractionCache(max_entries=1, disk_location=self.cache_dir, max_disk_bytes=entry_size * 3)
+        with patch.object(cache, '_disk_entries', wraps=cache._disk_entries) as mock_disk_entries:
+            for i, key in enumerate(['a', 'b', 'c', 'd']):
+                cache.set(key, self.company_data)
+                os.utime(os.path.join(self.cache_dir, f'{key}.json'), (i, i))
+
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['c.json', 'd.json'])
+        # once on the first write, then once the tier is over the limit
+        self.assertEqual(mock_disk_entries.call_count, 2)
+
+    def test_disk_tier_write_failure(self):
+        """
+        Expect a failure to write to the disk tier to be logged rather than raised, keeping the entry in memory.
+        """
+        disk_location = os.path.join(self.cache_dir, 'missing')
+        cache = ExtractionCache(max_entries=1, disk_location=disk_location, max_disk_bytes=1024)
+        os.rmdir(disk_location)
+
+        with self.assertLogs('src.extraction_cache', level='WARNING'):
+            cache.set('a', self.company_data)
+
+        self.assertEqual(cache.get('a'), self.company_data)
+
+
+class TestAsyncExtractionClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = AsyncExtractionClient(max_concurrency=2, max_workers=4, timeout=1)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_run_limits_concurrency(self):
+        """
+        Expect no more than max_concurrency calls to be in flight at once.
+        """
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_call(value):
+            with lock:
+                in_flight.append(value)
+                peak.append(len(in_flight))
+            time.sleep(0.02)
+            with lock:
+                in_flight.remove(value)
+            return value
+
+        async def run_all():
+            return await asyncio.gather(*(self.client.run(slow_call, i) for i in range(6)))
+
+        result = asyncio.run(run_all())
+
+        self.assertEqual(result, list(range(6)))
+        self.assertEqual(max(peak), 2)
+
+    def test_run_timeout(self):
+        """
+        Expect TimeoutError when a call takes longer than the configured timeout.
+        """
+        self.client.timeout = 0.01
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(self.client.run(time.sleep, 0.2))
+
+    @patch('src.pdf_service_api.PdfService.extract')
+    def test_extract(self, mock_extract):
+        """
+        Expect extract to return parsed CompanyData from the pdf service.
+        """
+        mock_extract.return_value = test_company_data
+
+        result = asyncio.run(self.client.extract(company_name='HealthInc', pdf_file='Fake File'))
+
+        self.assertEqual(result, CompanyData(**test_company_data))
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_synthetic_csv_loads(self):
+        """
+        Expect generated benchmark data to load through the csv backend.
+        """
+        fd, db_location = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        self.addCleanup(os.remove, db_location)
+
+        write_synthetic_csv(db_location, generate_company_rows(50))
+
+        result = CsvCompanyBackend(db_location).get('Company0000049')
+        self.assertEqual(result.company_name, 'Company0000049')
+
+    def test_compare_to_baseline(self):
+        """
+        Expect regressions to be reported only for results slower than the baseline by more than the tolerance.
+        """
+        baseline = {'microbenchmarks': {'a': {'per_op_us': 10}, 'b': {'per_op_us': 10}},
+                    'load_test': {'throughput_rps': 100, 'p99_ms': 50}}
+        results = {'microbenchmarks': {'a': {'per_op_us': 11}, 'b': {'per_op_us': 13}},
+                   'load_test': {'throughput_rps': 70, 'p99_ms': 55}}
+
+        regressions = compare_to_baseline(results, baseline, tolerance=0.2)
+
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('b:'))
+        self.assertTrue(regressions[1].startswith('load_test throughput'))
+
+
+class TestReconcile(unittest.TestCase):
+
+    def setUp(self):
+        self.extracted_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.extracted_dir)
+        stored = load_company_data('TechCorp').model_dump(by_alias=True, mode='json')
+        self.write_extracted('techcorp.json', json.dumps(stored))
+        self.write_extracted('retailco.json', json.dumps({**stored, 'Company Name': 'RetailCo'}))
+        self.write_extracted('fakecompany.json', json.dumps({**stored, 'Company Name': 'Fake Company'}))
+        self.write_extracted('broken.json', '{')
+        self.output = os.path.join(self.extracted_dir, 'report.ndjson')
+
+    def write_extracted(self, file_name, content):
+        with open(os.path.join(self.extracted_dir, file_name), 'w') as f:
+            f.write(content)
+
+    def test_reconcile(self):
+        """
+        Expect one line per extracted file, with mismatches and per-file errors reported inline.
+        """
+        exit_code = reconcile_main([settings.db_location, self.extracted_dir, '--output', self.output,
+                                    '--mismatches-only', '--fail-on-mismatch'])
+
+        with open(self.output) as f:
+            lines = {item['company_name']: item for item in map(json.loads, f)}
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(set(lines), {'TechCorp', 'RetailCo', 'Fake Company', 'broken'})
+        self.assertEqual(lines['TechCorp']['result'], {'mismatched_fields': []})
+        self.assertIn('industry', [field['field_name'] for field in lines['RetailCo']['result']['mismatched_fields']])
+        self.assertEqual(lines['Fake Company']['error'], 'No data found for this company name.')
+        self.assertTrue(lines['broken']['error'].startswith('Cannot read extracted data from broken.json'))
+
+
+class TestImportTime(unittest.TestCase):
+    # generous, to catch heavy imports creeping in rather than to benchmark; see import times in src.benchmarks
+    budget_us = 2_000_000
+
+    def test_offline_modules_skip_web_stack(self):
+        """
+        Expect the reconcile cli and discrepancy checker to import without FastAPI and within the import budget.
+        """
+        for module in ['src.reconcile', 'src.data_discrepancy_checker']:
+            with self.subTest(module=module):
+                times = import_times(module)
+
+                self.assertNotIn('fastapi', times)
+                self.assertNotIn('starlette', times)
+                self.assertNotIn('pydantic_settings', times)
+                self.assertLess(times[module], self.budget_us)
+
+    def test_settings_not_built_at_import(self):
+        """
+        Expect modules that read settings to leave building them until first use.
+        """
+        code = ("import src.reconcile, src.data_layer, src.shared_cache, src.snapshot; "
+                "from src.config import get_settings; print(get_settings.cache_info().currsize)")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        completed = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+
+        self.assertEqual(completed.stdout.strip(), '0')
 
 
 if __name__ == '__main__':
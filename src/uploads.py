@@ -0,0 +1,98 @@
+import hashlib
+import tempfile
+from typing import AsyncIterator, Callable
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+UPLOAD_TOO_LARGE_MESSAGE = "Uploaded file is too large."
+
+
+class UploadTooLargeError(HTTPException):
+    """
+    Raised while reading a request body that goes over its size limit. Subclasses HTTPException so it isn't
+    swallowed by form parsing and reaches the app's exception handler.
+    """
+
+    def __init__(self):
+        super().__init__(status_code=413, detail=UPLOAD_TOO_LARGE_MESSAGE)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware bounding request body sizes, per path, before the body is buffered or spooled anywhere.
+
+    Requests declaring a Content-Length over the limit are rejected with 413 without reading the body. Bodies
+    without a Content-Length (chunked uploads) are counted as they arrive and raise UploadTooLargeError once
+    they go over the limit.
+    """
+
+    def __init__(self, app, limit_for_path: Callable[[str], int | None]):
+        self.app = app
+        self.limit_for_path = limit_for_path
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self.limit_for_path(scope["path"]) if scope["type"] == "http" else None
+        if max_bytes is None:
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            response = JSONResponse(content={"error": UPLOAD_TOO_LARGE_MESSAGE}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise UploadTooLargeError()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class HashedUpload:
+    """
+    A pdf received as a stream, spooled to memory (or a temp file once large) and hashed as it arrived.
+    The digest is handed to extraction along with the file, so the file is never re-read just to hash it.
+    """
+
+    def __init__(self, pdf_file: tempfile.SpooledTemporaryFile, pdf_digest: str, size: int):
+        self.pdf_file = pdf_file
+        self.pdf_digest = pdf_digest
+        self.size = size
+
+    def close(self):
+        self.pdf_file.close()
+
+
+async def receive_pdf_upload(chunks: AsyncIterator[bytes], spool_max_bytes: int) -> HashedUpload:
+    """
+    Read a pdf from a stream of chunks (e.g. Request.stream()), hashing each chunk as it arrives.
+
+    :param chunks: async iterator of body chunks
+    :param spool_max_bytes: size above which the pdf is spooled to a temp file rather than kept in memory
+    :return: HashedUpload positioned at the start of the file
+    """
+    pdf_file = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async for chunk in chunks:
+            hasher.update(chunk)
+            size += len(chunk)
+            # in-memory writes are cheap, only hand writes off to a thread once the file is spooled to disk
+            # (the write taking it over spool_max_bytes is the one that rolls it over)
+            if size > spool_max_bytes:
+                await run_in_threadpool(pdf_file.write, chunk)
+            else:
+                pdf_file.write(chunk)
+    except BaseException:
+        pdf_file.close()
+        raise
+    pdf_file.seek(0)
+    return HashedUpload(pdf_file, hasher.hexdigest(), size)